@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, render_template, request, send_file, jsonify, abort
 import pandas as pd
 import sqlalchemy
 import configparser
@@ -12,10 +12,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
 import zipfile
+import re
 from werkzeug.utils import secure_filename
 import urllib.parse
 from calculations import *
+from db import get_engine, pool_stats
+import ref_cache
+import jobs
+import artifacts
+import metrics
+import slow_queries
+from report_writer import REPORT_IN_MEMORY_ROWS, ReportWriter, send_report
 from datetime import datetime
+import itertools
 
 logging.getLogger('matplotlib.category').setLevel(logging.WARNING)
 
@@ -28,24 +37,35 @@ logger = logging.getLogger()
 load_dotenv()
 
 app = Flask(__name__)
+metrics.init_app(app)
 
-# Load configuration# Function to create MySQL connection using SQLAlchemy
+# Pick up jobs queued or interrupted before this process started. On the first request rather
+# than at import, so a gunicorn --preload master never runs them.
+@app.before_request
+def start_jobs():
+    jobs.ensure_started()
+
+# Shared pooled engine (see db.py); kept as a function for existing callers
 def create_connection():
-    user = os.getenv('user')
-    password = os.getenv('password')
-    host = os.getenv('host')
-    database = os.getenv('database')
-    
-    # Encode the password to handle special characters
-    encoded_password = urllib.parse.quote_plus(password)
-    
-    # Create the connection string with the encoded password
-    connection_str = f"mysql+mysqlconnector://{user}:{encoded_password}@{host}/{database}"
-    engine = sqlalchemy.create_engine(connection_str)
-    return engine
+    return get_engine()
 
 engine=create_connection()
 
+# (artifact key, result) of a report task(params, target), built in memory only when no
+# artifact matches the report, its parameters and the current data (see artifacts.py)
+def cached_report(kind, params, task, download_name):
+    return artifacts.get_or_build(kind, params, lambda target: task(params, target), download_name, engine)
+
+# The report's workbook as an open file; a cached one evicted by another request before it
+# was opened is built again (a fresh build is never evicted right away)
+def cached_workbook(kind, params, task, download_name):
+    for _ in range(2):
+        artifact_key, _ = cached_report(kind, params, task, download_name)
+        workbook = artifacts.open_workbook(artifact_key)
+        if workbook is not None:
+            return workbook
+    raise FileNotFoundError(f"artifact {artifact_key} was evicted before it could be sent")
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -58,56 +78,58 @@ def form_total_fw():
 def process_total_fw():
     logger.info("Processing the total FW")
     company_name = request.form['company_name']
-    start_date = request.form['start_date']
-    end_date = request.form['end_date']
 
     try:
-        # Fetch data
-        fw = fetch_total_fw(engine, company_name, start_date, end_date)
-
-        if fw.empty:
-            return "No data found for the given parameters."
+        workbook = cached_workbook('total_fw', request.form.to_dict(), total_fw_report, f"{company_name}_Total_FW.xlsx")
+    except ValueError as e:
+        return str(e)
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}")
+        return f"An error occurred: {str(e)}"
+    return send_file(workbook, as_attachment=True, download_name=f"{company_name}_Total_FW.xlsx")
 
-        # Process data into a pivot table
-        np_fw = fw[fw['IGD_CATEGORY_ID'] != 'PLATE']
-        plate = fw[fw['IGD_CATEGORY_ID'] == 'PLATE']
-        pivot = np_fw.pivot_table(index=['COMPANY_NAME', 'KICHEN_NAME'], columns='IGD_FOODTYPE_ID', values='AMOUNT', aggfunc='sum').reset_index()
-        plate = plate.pivot_table(index=['COMPANY_NAME', 'KICHEN_NAME'], columns='IGD_CATEGORY_ID', values='AMOUNT', aggfunc='sum').reset_index()
-        pivot['START'] = np_fw['OPERATION_DATE'].min()
-        pivot['END'] = np_fw['OPERATION_DATE'].max()
+def total_fw_report(params, file_path):
+    company_name = params['company_name']
+    start_date = params['start_date']
+    end_date = params['end_date']
 
-        # Select columns containing float values for summation
-        float_columns = pivot.select_dtypes(include=['float64', 'int64']).columns
+    # Fetch data
+    fw = fetch_total_fw(engine, company_name, start_date, end_date)
 
-        # Calculate the total sum horizontally (ignores NaN values)
-        pivot['TOTAL'] = pivot[float_columns].sum(axis=1)
+    if fw.empty:
+        raise ValueError("No data found for the given parameters.")
 
-        # Find the insertion index for the 'TOTAL' column (before 'START' and 'END')
-        start_index = pivot.columns.get_loc('START')
+    # Process data into a pivot table
+    with metrics.stage('total_fw.pivot'):
+        np_fw = fw[fw['IGD_CATEGORY_ID'] != 'PLATE']
+        plate = fw[fw['IGD_CATEGORY_ID'] == 'PLATE']
+        pivot = np_fw.pivot_table(index=['COMPANY_NAME', 'KICHEN_NAME'], columns='IGD_FOODTYPE_ID', values='AMOUNT', aggfunc='sum', observed=True).reset_index()
+        plate = plate.pivot_table(index=['COMPANY_NAME', 'KICHEN_NAME'], columns='IGD_CATEGORY_ID', values='AMOUNT', aggfunc='sum', observed=True).reset_index()
+    pivot['START'] = np_fw['OPERATION_DATE'].min()
+    pivot['END'] = np_fw['OPERATION_DATE'].max()
 
-        # Reorder columns to place 'TOTAL' before 'START'
-        columns_order = list(pivot.columns)
-        columns_order.remove('TOTAL')
-        columns_order.insert(start_index, 'TOTAL')
+    # Select columns containing float values for summation
+    float_columns = pivot.select_dtypes(include=['float64', 'int64']).columns
 
-        # Reassign the reordered columns
-        pivot = pivot[columns_order]
-        # Create the file path for the CSV
-        temp_dir = tempfile.gettempdir()  # Gets the temporary directory
-        file_path = os.path.join(temp_dir, f"{company_name}_Total_FW.xlsx")
+    # Calculate the total sum horizontally (ignores NaN values)
+    pivot['TOTAL'] = pivot[float_columns].sum(axis=1)
 
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            pivot.to_excel(writer, sheet_name='Total_FW_NO_PLATE', index=False) 
-            plate.to_excel(writer, sheet_name='Total_PLATE', index=False)
+    # Find the insertion index for the 'TOTAL' column (before 'START' and 'END')
+    start_index = pivot.columns.get_loc('START')
 
+    # Reorder columns to place 'TOTAL' before 'START'
+    columns_order = list(pivot.columns)
+    columns_order.remove('TOTAL')
+    columns_order.insert(start_index, 'TOTAL')
 
-        return send_file(file_path, as_attachment=True)
+    # Reassign the reordered columns
+    pivot = pivot[columns_order]
 
+    with ReportWriter(file_path) as report:
+        report.write('Total_FW_NO_PLATE', pivot)
+        report.write('Total_PLATE', plate)
+    return None
 
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return f"An error occurred: {str(e)}"
-    
 @app.route('/form_entries')
 def form_entries():
     return render_template('form_entries.html')
@@ -119,34 +141,46 @@ def process_entries():
     start_date = request.form['start_date']
     end_date = request.form['end_date']
     try:
-        fw = fetch_fw_entries(engine, company_name, start_date, end_date)
-        cv = fetch_cv_entries(engine, company_name, start_date, end_date)
-        if fw.empty and cv.empty:
-            return "No data found for the given parameters."
-       
         fw_columns = {'COMPANY_NAME': 'Property', 'KICHEN_NAME': 'Kitchen', 'OPERATION_DATE': 'Date', 'SHIFT_ID': 'Shift', 'IGD_CATEGORY_ID': 'Category', 'IGD_FOODTYPE_ID': 'Type of food', 'AMOUNT': 'Weight'}
         cv_columns = {'COMPANY_NAME': 'Property', 'KICHEN_NAME': 'Kitchen', 'OPERATION_DATE': 'Date', 'SHIFT_ID': 'Shift', 'AMOUNT': 'Covers'}
-        fw2 = fw.rename(columns=fw_columns)
-        cv2 = cv.rename(columns=cv_columns)
-        sorted_fw = fw2[['Date','Property','Kitchen','Shift','Category','Weight','Type of food']]
-        sorted_cv = cv2[['Date','Property','Kitchen','Shift','Covers']]
         replacement = {'DAIRY':'Dairy/Egg','STAPLE_FOOD':'Staple food'}
-        sorted_fw.loc[:,'Type of food'] = sorted_fw['Type of food'].replace(replacement)
-
-        # Add how many entries per kitchen 
-        entry_counts = sorted_fw.groupby(['Property','Kitchen']).size().reset_index(name='Count')        
-
-        temp_dir = tempfile.gettempdir()  # Gets the temporary directory
-        file_path = os.path.join(temp_dir, f"{company_name}_FW&CV_Entries.xlsx")
-        # Read dataframe into excel
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-        # Write each DataFrame to a specific sheet
-            sorted_fw.to_excel(writer, sheet_name='FW', index=False)
-            sorted_cv.to_excel(writer, sheet_name='CV', index=False)
-            entry_counts.to_excel(writer, sheet_name='FW Entry Counts', index=False)
-        # Return the file as a download
-        return send_file(file_path, as_attachment=True)
-    
+        entry_counts = []
+
+        def fw_chunks(chunks):
+            for fw in chunks:
+                sorted_fw = fw.rename(columns=fw_columns)[['Date','Property','Kitchen','Shift','Category','Weight','Type of food']]
+                # Snapshot chunks are categorical (schema.py); relabel them as plain strings
+                sorted_fw['Type of food'] = sorted_fw['Type of food'].astype(object).replace(replacement)
+                # Add how many entries per kitchen
+                entry_counts.append(sorted_fw.groupby(['Property','Kitchen'], observed=True).size())
+                yield sorted_fw
+
+        def cv_chunks(chunks):
+            for cv in chunks:
+                yield cv.rename(columns=cv_columns)[['Date','Property','Kitchen','Shift','Covers']]
+
+        # Read the first chunk of each export up front to answer "no data" before the
+        # download starts; the rest is streamed chunk by chunk straight into the sheets
+        fw = stream_fw_entries(engine, company_name, start_date, end_date)
+        cv = stream_cv_entries(engine, company_name, start_date, end_date)
+        first_fw, first_cv = next(fw), next(cv)
+        if first_fw.empty and first_cv.empty:
+            fw.close()
+            cv.close()
+            return "No data found for the given parameters."
+
+        def build(report):
+            report.write_chunks('FW', fw_chunks(itertools.chain([first_fw], fw)))
+            report.write_chunks('CV', cv_chunks(itertools.chain([first_cv], cv)))
+            counts = pd.concat(entry_counts).groupby(level=['Property','Kitchen'], observed=True).sum()
+            report.write('FW Entry Counts', counts.reset_index(name='Count'))
+
+        # A first chunk shorter than the chunk size is the whole export: small ones are
+        # assembled entirely in memory, without worksheet temp files
+        small = (len(first_fw) < ENTRIES_CHUNKSIZE and len(first_cv) < ENTRIES_CHUNKSIZE and
+                 len(first_fw) + len(first_cv) <= REPORT_IN_MEMORY_ROWS)
+        return send_report(build, f"{company_name}_FW&CV_Entries.xlsx", in_memory=small)
+
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         return f"An error occurred: {str(e)}"
@@ -155,233 +189,164 @@ def process_entries():
 def form_dcon():
     return render_template('form_dcon.html')
 
-@app.route('/process_dcon', methods=['GET', 'POST'])
-def process_dcon():
-    company_name = request.form.get('company_name')
-    start_date_str = request.form.get('start_date')
-    end_date_str = request.form.get('end_date')
+# Report computations shared by the synchronous routes and the background jobs (jobs.py):
+# each takes the form fields and the path (or buffer) to write the workbook to, and returns the
+# template and context to render (template None = the result is the workbook itself).
+@jobs.task('dcon')
+def dcon_report(params, file_path):
+    company_name = params.get('company_name')
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
 
     # Validate input fields
     if not company_name or not start_date_str or not end_date_str:
-        return "All fields (company_name, start_date, end_date) are required."
+        raise ValueError("All fields (company_name, start_date, end_date) are required.")
+
+    # Convert date strings to datetime objects
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+
+    # Validate date range
+    if end_date < start_date:
+        raise ValueError("End date must be after start date.")
+
+    # One fetch for the whole range: before the July 2024 cutoff DCON applies the old
+    # (non-CONS) checks and the new method after it, the same split the report has always
+    # used; monthly and overall are rollups of the same cube
+    cube = DCON_cube(
+        engine=engine,
+        company_name=company_name,
+        start_date=start_date_str,
+        end_date=end_date_str,
+        CONS=False
+    )
+    if cube is None:
+        raise ValueError("No data found for the selected company and dates.")
+    monthly = cube.rollup('monthly').sort_values(by=['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE'])
+    overall = cube.rollup('overall')
+
+    # Select relevant columns
+    monthly = monthly[['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE', 'CONSISTENCY', 'COMP_SHIFTS', 'TOTAL_SHIFTS', 'CLOSED_SHIFTS']]
+    overall = overall[['COMPANY_NAME', 'KICHEN_NAME', 'CONSISTENCY', 'COMP_SHIFTS', 'TOTAL_SHIFTS', 'CLOSED_SHIFTS', 'START_DATE', 'END_DATE']]
+
+    # Store the Excel file for download
+    with ReportWriter(file_path) as report:
+        report.write('Monthly Data', monthly)
+        report.write('Overall Data', overall)
+
+    # Convert dataframes to HTML for rendering
+    return 'consistency.html', {
+        'month_table': monthly.to_html(classes='table table-striped table-bordered table-hover', index=False),
+        'overall_table': overall.to_html(classes='table table-striped table-bordered table-hover', index=False),
+        'start_date': start_date_str,
+        'end_date': end_date_str,
+    }
 
+@app.route('/process_dcon', methods=['GET', 'POST'])
+def process_dcon():
+    company_name = request.form.get('company_name')
     try:
-        # Convert date strings to datetime objects
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        cutoff_date = datetime(2024, 6, 30)
-
-        # Validate date range
-        if end_date < start_date:
-            return "End date must be after start date."
-
-        # Determine periods based on cutoff_date
-        periods = []
-
-        if end_date <= cutoff_date:
-            # Entire period before cutoff_date (No CONS)
-            periods.append({
-                'start_date': start_date_str,
-                'end_date': end_date_str,
-                'CONS': False
-            })
-        elif start_date > cutoff_date:
-            # Entire period after cutoff_date (Apply CONS)
-            periods.append({
-                'start_date': start_date_str,
-                'end_date': end_date_str,
-                'CONS': True
-            })
-        else:
-            # Period spans cutoff_date; split into pre and post periods
-            periods.append({
-                'start_date': start_date_str,
-                'end_date': cutoff_date.strftime('%Y-%m-%d'),
-                'CONS': False
-            })
-            periods.append({
-                'start_date': (cutoff_date + timedelta(days=1)).strftime('%Y-%m-%d'),
-                'end_date': end_date_str,
-                'CONS': True
-            })
-
-        # Initialize lists to collect dataframes
-        monthly_dfs = []
-        overall_dfs = []
-
-        for period in periods:
-            # Fetch monthly data
-            month_df = DCON(
-                engine=engine,
-                company_name=company_name,
-                start_date=period['start_date'],
-                end_date=period['end_date'],
-                grouping='monthly',
-                CONS=period['CONS']
-            )
-            monthly_dfs.append(month_df)
-
-            # Fetch overall data
-            ov_df = DCON(
-                engine=engine,
-                company_name=company_name,
-                start_date=period['start_date'],
-                end_date=period['end_date'],
-                grouping='overall',
-                CONS=period['CONS']
-            )
-            overall_dfs.append(ov_df)
-
-        # Concatenate dataframes
-        monthly = pd.concat(monthly_dfs).sort_values(by=['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE'])
-        overall = pd.concat(overall_dfs)
-
-        # Aggregate overall data
-        overall = overall.groupby(['COMPANY_NAME', 'KICHEN_NAME']).agg({
-            'COMP_SHIFTS': 'sum',
-            'TOTAL_SHIFTS': 'sum',
-            'CLOSED_SHIFTS': 'sum',
-            'START_DATE': 'min',
-            'END_DATE': 'max'
-        }).reset_index()
-        overall['CONSISTENCY'] = (overall['COMP_SHIFTS'] / (overall['TOTAL_SHIFTS'] - overall['CLOSED_SHIFTS'])).round(2)
-
-        # Select relevant columns
-        monthly = monthly[['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE', 'CONSISTENCY', 'COMP_SHIFTS', 'TOTAL_SHIFTS', 'CLOSED_SHIFTS']]
-        overall = overall[['COMPANY_NAME', 'KICHEN_NAME', 'CONSISTENCY', 'COMP_SHIFTS', 'TOTAL_SHIFTS', 'CLOSED_SHIFTS', 'START_DATE', 'END_DATE']]
-
-        # Store the Excel file for download
-        temp_dir = tempfile.gettempdir()
-        file_path = os.path.join(temp_dir, f"{company_name}_dcon_data.xlsx")
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            monthly.to_excel(writer, sheet_name='Monthly Data', index=False)
-            overall.to_excel(writer, sheet_name='Overall Data', index=False)
-
-        # Convert dataframes to HTML for rendering
-        month_table = monthly.to_html(classes='table table-striped table-bordered table-hover', index=False)
-        overall_table = overall.to_html(classes='table table-striped table-bordered table-hover', index=False)
-
-        # Return rendered template
-        return render_template(
-            'consistency.html',
-            month_table=month_table,
-            overall_table=overall_table,
-            start_date=start_date_str,
-            end_date=end_date_str,
-            download_link=f"/download_excel/{os.path.basename(file_path)}"
-        )
-
+        artifact_key, (template, context) = cached_report('dcon', request.form.to_dict(), dcon_report, f"{company_name}_dcon_data.xlsx")
+    except ValueError as e:
+        return str(e)
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         return "An internal error occurred. Please try again later."
 
+    # Return rendered template
+    return render_template(template, download_link=f"/download_excel/{artifact_key}", **context)
+
 
 @app.route('/form_weekly')
 def form_weekly():
     return render_template('form_weekly.html')
 
-@app.route('/weekly_results', methods=['POST'])
-def weekly_results():
-    logger.info("Processing the wdcon")
-    
-    # Retrieve form data
-    start_date = request.form['start_date']
-    end_date = request.form['end_date']
-    parent = request.form.get('parent_company')
-    filter_option = request.form.get('calc_options')  # Matching form name
-    
+def calc_method(filter_option):
     # Set calculation method based on selection
     if filter_option == 'cons_false':
-        CONS = False
-        method = 'Pre-July2024'
+        return False, 'Pre-July2024'
     elif filter_option == 'cons_true':
-        CONS = True
-        method = 'Post-July2024'
-    
-    try:
-        # Calculate weekly DCON
-        week = DCON(engine=engine, start_date=start_date, end_date=end_date, grouping='weekly', CONS=CONS)
-        logger.info("Calculated weekly dcon")
-        
-        today = datetime.now()
-        # Group by parent company
-        week = group_by_parent_company(week)
-        week = week[week['LICENSE_EXPIRE_DATE'] >= today]
-        week = week[['COMPANY_NAME', 'KICHEN_NAME', 'WEEK_START_DATE', 'CONSISTENCY','COMP_SHIFTS','TOTAL_SHIFTS','CLOSED_SHIFTS','PARENT_COMPANY']]
-        # Filter by company
-        constance = week[week['PARENT_COMPANY'].isin(['Constance'])]
-        hyatt = week[week['PARENT_COMPANY'].isin(['Hyatt'])]
-        marriott = week[~week['PARENT_COMPANY'].isin(['Constance', 'Hyatt'])]
-
-        # Calculate average per group
-        avg_constance = constance['CONSISTENCY'].mean()
-        avg_hyatt = hyatt['CONSISTENCY'].mean()
-        avg_marriott = marriott['CONSISTENCY'].mean()
-        avg_per_parent = pd.DataFrame({
-            'PARENT_COMPANY': ['Constance', 'Hyatt', 'Marriott & Others'],
-            'CONSISTENCY': [avg_constance, avg_hyatt, avg_marriott]
-        })
-        
-        # Store the Excel file for download
-        temp_dir = tempfile.gettempdir()
-        file_path = os.path.join(temp_dir, f"all_dcon_{method}.xlsx")
-        
-        # Save different sheets for each company
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            constance.to_excel(writer, sheet_name='Constance', index=False)
-            hyatt.to_excel(writer, sheet_name='Hyatt', index=False)
-            marriott.to_excel(writer, sheet_name='Marriott & Others', index=False)
-            avg_per_parent.to_excel(writer, sheet_name='Average per Group', index=False)
-        
-        # Generate download link
-        download_link = f"/download_excel/{os.path.basename(file_path)}"
-        
-        # Convert avg_per_parent DataFrame to HTML table
-        avg_per_parent_table = avg_per_parent.to_html(classes='table table-striped table-bordered table-hover', index=False)
-        
-        # Render the appropriate table based on parent company selection
-        if parent == 'constance':
-            week_table = constance.to_html(classes='table table-striped table-bordered table-hover', index=False)
-            week_table = week_table.replace('<table ', '<table id="week_table" ')
-            return render_template(
-                'weekly_dcon.html',
-                week_table=week_table,
-                avg_per_parent_table=avg_per_parent_table,
-                start_date=start_date,
-                end_date=end_date,
-                download_link=download_link, parent_company=parent.capitalize())
-        elif parent == 'hyatt':
-            week_table = hyatt.to_html(classes='table table-striped table-bordered table-hover', index=False)
-            week_table = week_table.replace('<table ', '<table id="week_table" ')
-            return render_template(
-                'weekly_dcon.html',
-                week_table=week_table,
-                avg_per_parent_table=avg_per_parent_table,
-                start_date=start_date,
-                end_date=end_date,
-                download_link=download_link, parent_company=parent.capitalize())
-        else:
-            week_table = marriott.to_html(classes='table table-striped table-bordered table-hover', index=False)
-            week_table = week_table.replace('<table ', '<table id="week_table" ')
-            return render_template(
-                'weekly_dcon.html',
-                week_table=week_table,
-                avg_per_parent_table=avg_per_parent_table,
-                start_date=start_date,
-                end_date=end_date,
-                download_link=download_link, parent_company='Marriott & Others')
+        return True, 'Post-July2024'
+    raise ValueError("Select a calculation method.")
+
+@jobs.task('weekly_dcon')
+def weekly_report(params, file_path):
+    # Retrieve form data
+    start_date = params['start_date']
+    end_date = params['end_date']
+    parent = params.get('parent_company')
+    CONS, method = calc_method(params.get('calc_options'))
+
+    # Calculate weekly DCON
+    week = DCON(engine=engine, start_date=start_date, end_date=end_date, grouping='weekly', CONS=CONS)
+    logger.info("Calculated weekly dcon")
+
+    today = datetime.now()
+    # Group by parent company
+    week = group_by_parent_company(week)
+    week = week[week['LICENSE_EXPIRE_DATE'] >= today]
+    week = week[['COMPANY_NAME', 'KICHEN_NAME', 'WEEK_START_DATE', 'CONSISTENCY','COMP_SHIFTS','TOTAL_SHIFTS','CLOSED_SHIFTS','PARENT_COMPANY']]
+    # Filter by company
+    constance = week[week['PARENT_COMPANY'].isin(['Constance'])]
+    hyatt = week[week['PARENT_COMPANY'].isin(['Hyatt'])]
+    marriott = week[~week['PARENT_COMPANY'].isin(['Constance', 'Hyatt'])]
+
+    # Calculate average per group
+    avg_constance = constance['CONSISTENCY'].mean()
+    avg_hyatt = hyatt['CONSISTENCY'].mean()
+    avg_marriott = marriott['CONSISTENCY'].mean()
+    avg_per_parent = pd.DataFrame({
+        'PARENT_COMPANY': ['Constance', 'Hyatt', 'Marriott & Others'],
+        'CONSISTENCY': [avg_constance, avg_hyatt, avg_marriott]
+    })
+
+    # Save different sheets for each company
+    with ReportWriter(file_path) as report:
+        report.write('Constance', constance)
+        report.write('Hyatt', hyatt)
+        report.write('Marriott & Others', marriott)
+        report.write('Average per Group', avg_per_parent)
+
+    # Convert avg_per_parent DataFrame to HTML table
+    avg_per_parent_table = avg_per_parent.to_html(classes='table table-striped table-bordered table-hover', index=False)
+
+    # Render the appropriate table based on parent company selection
+    if parent == 'constance':
+        week_table, parent_company = constance, parent.capitalize()
+    elif parent == 'hyatt':
+        week_table, parent_company = hyatt, parent.capitalize()
+    else:
+        week_table, parent_company = marriott, 'Marriott & Others'
+    week_table = week_table.to_html(classes='table table-striped table-bordered table-hover', index=False)
+    week_table = week_table.replace('<table ', '<table id="week_table" ')
+    return 'weekly_dcon.html', {
+        'week_table': week_table,
+        'avg_per_parent_table': avg_per_parent_table,
+        'start_date': start_date,
+        'end_date': end_date,
+        'parent_company': parent_company,
+    }
 
+@app.route('/weekly_results', methods=['POST'])
+def weekly_results():
+    logger.info("Processing the wdcon")
+    try:
+        _, method = calc_method(request.form.get('calc_options'))
+        artifact_key, (template, context) = cached_report('weekly_dcon', request.form.to_dict(), weekly_report, f"all_dcon_{method}.xlsx")
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         return f"An error occurred: {str(e)}"
 
+    # Generate download link
+    return render_template(template, download_link=f"/download_excel/{artifact_key}", **context)
+
 @app.route('/form_wdcon', methods=['GET', 'POST'])
 def form_wdcon():
     return render_template('form_wdcon.html')
 
 
 # Function for core logic of wdcon processing
-def wdcon_logic(start_date, end_date, parent, CONS):
+def wdcon_logic(start_date, end_date, parent, CONS, file_path=None):
     logger.info("Processing wdcon logic")
 
     # Call the DCON function
@@ -406,43 +371,170 @@ def wdcon_logic(start_date, end_date, parent, CONS):
     })
 
     # Store Excel file for download
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, f"all_dcon_Pre_July2024.xlsx")  # Just an example
+    if file_path is None:
+        temp_dir = tempfile.gettempdir()
+        file_path = os.path.join(temp_dir, f"all_dcon_Pre_July2024.xlsx")  # Just an example
 
-    with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-        constance.to_excel(writer, sheet_name='Constance', index=False)
-        hyatt.to_excel(writer, sheet_name='Hyatt', index=False)
-        marriott.to_excel(writer, sheet_name='Marriott & Others', index=False)
-        avg_per_parent.to_excel(writer, sheet_name='Average per Group', index=False)
+    with ReportWriter(file_path) as report:
+        report.write('Constance', constance)
+        report.write('Hyatt', hyatt)
+        report.write('Marriott & Others', marriott)
+        report.write('Average per Group', avg_per_parent)
 
     return file_path, avg_per_parent
 
+@jobs.task('wdcon')
+def wdcon_job(params, file_path):
+    wdcon_logic(params['start_date'], params['end_date'], params.get('parent_company'),
+                params.get('calc_options') == 'cons_true', file_path=file_path)
+    return None, {}
+
 # The Flask route remains the same
 @app.route('/process_wdcon', methods=['POST'])
 def process_wdcon():
     logger.info("Processing the wdcon route")
 
-    # Get form data from request
-    start_date = request.form['start_date']
-    end_date = request.form['end_date']
-    parent = request.form.get('parent_company')
-    filter_option = request.form.get('calc_options')
-
-    # Set calculation method based on selection
-    CONS = filter_option == 'cons_true'
-
-    # Call the logic function
-    file_path, avg_per_parent = wdcon_logic(start_date, end_date, parent, CONS)
-
-    # Handle further response logic (e.g., rendering or sending file)
-    return send_file(file_path, as_attachment=True)     
-
-@app.route('/download_excel/<filename>')
-def download_excel(filename):
-    
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, filename)
-    return send_file(file_path, as_attachment=True)
+    # Same form fields as the wdcon job; the workbook is built by wdcon_logic
+    params = request.form.to_dict()
+    method = 'Post_July2024' if params.get('calc_options') == 'cons_true' else 'Pre_July2024'
+    download_name = f"all_dcon_{method}.xlsx"
+    workbook = cached_workbook('wdcon', params, wdcon_job, download_name)
+    return send_file(workbook, as_attachment=True, download_name=download_name)
+
+def form_flag(value):
+    return str(value).lower() in ('1', 'true', 'on', 'yes')
+
+@jobs.task('savings')
+def savings_report(params, file_path):
+    company_name = params.get('company_name') or None
+    if not company_name:
+        raise ValueError("company_name is required.")
+    savings = get_savings(
+        start_date=params.get('start_date') or None,
+        end_date=params.get('end_date') or None,
+        CONS=form_flag(params.get('CONS')),
+        company_name=company_name,
+        restaurant_name=params.get('restaurant_name') or None,
+        MergeKitchen=form_flag(params.get('MergeKitchen')),
+        MergeComp=form_flag(params.get('MergeComp')),
+        baseline=int(params.get('baseline') or 1),
+    )
+    if savings is None or savings.empty:
+        raise ValueError("No baselines found for the specified kitchen and company.")
+
+    with ReportWriter(file_path) as report:
+        report.write('Savings', savings)
+    return 'savings.html', {
+        'savings_table': savings.to_html(classes='table table-striped table-bordered table-hover', index=False),
+        'company_name': company_name,
+        'start_date': params.get('start_date'),
+        'end_date': params.get('end_date'),
+    }
+
+# Savings of several companies (one per line or comma-separated; blank for every active
+# company) in one batched pass, one row per company and kitchen
+@jobs.task('savings_fleet')
+def savings_fleet_report(params, file_path):
+    companies = [name.strip() for name in re.split(r'[,\n]', params.get('companies') or '') if name.strip()]
+    savings = get_savings_batch(
+        companies=companies or None,
+        start_date=params.get('start_date') or None,
+        end_date=params.get('end_date') or None,
+        CONS=form_flag(params.get('CONS')),
+        baseline=int(params.get('baseline') or 1),
+    )
+    if savings is None or savings.empty:
+        raise ValueError("No baselines found for the specified companies.")
+
+    with ReportWriter(file_path) as report:
+        report.write('Savings', savings)
+    return 'savings.html', {
+        'savings_table': savings.to_html(classes='table table-striped table-bordered table-hover', index=False),
+        'company_name': ', '.join(companies) if companies else 'All active companies',
+        'start_date': params.get('start_date'),
+        'end_date': params.get('end_date'),
+    }
+
+# Background jobs: POST the same form fields as the synchronous route to /jobs/<kind>
+# (dcon, weekly_dcon, wdcon, savings, savings_fleet), poll /jobs/<id>, then open /jobs/<id>/result
+@app.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    try:
+        job_id = jobs.submit(kind, request.form.to_dict())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({'id': job_id, 'status': jobs.QUEUED, 'status_url': f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    status = {key: job[key] for key in ('id', 'kind', 'status', 'created_at', 'started_at', 'finished_at', 'error', 'user_error')}
+    if job['status'] == jobs.DONE:
+        status['result_url'] = f"/jobs/{job_id}/result"
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != jobs.DONE:
+        # Bad parameters (the task's ValueError) are the caller's to fix: 422, not a server fault
+        if job['status'] in (jobs.QUEUED, jobs.RUNNING):
+            code = 202
+        else:
+            code = 422 if job['user_error'] else 500
+        return jsonify({'id': job_id, 'status': job['status'], 'error': job['error']}), code
+    template, context = job['result']
+    if template is None or request.args.get('format') == 'xlsx':
+        return send_file(job['excel_path'], as_attachment=True, download_name=f"{job['kind']}_{job_id}.xlsx")
+    return render_template(template, download_link=f"/jobs/{job_id}/result?format=xlsx", **context)
+
+@app.route('/pool_stats')
+def pool_stats_route():
+    return jsonify(pool_stats())
+
+# Query, report stage and route latency histograms (metrics.py) for Prometheus
+@app.route('/metrics')
+def metrics_route():
+    return metrics.expose(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+# Statements slower than SLOW_QUERY_SECONDS with their plans (slow_queries.py);
+# ?caller= filters, ?limit= (default 100), ?format=json for the raw records. Not served
+# unless SLOW_QUERY_ENABLED: the records show SQL, parameter values and plans
+@app.route('/slow_queries')
+def slow_queries_route():
+    if not slow_queries.SLOW_QUERY_ENABLED:
+        abort(404)
+    caller = request.args.get('caller') or None
+    limit = request.args.get('limit', 100, type=int)
+    records = slow_queries.records(limit=limit, caller=caller)
+    if request.args.get('format') == 'json':
+        return jsonify(records)
+    return render_template('slow_queries.html', records=records, caller=caller, limit=limit,
+                           threshold=slow_queries.SLOW_QUERY_SECONDS)
+
+@app.route('/cache_stats')
+def cache_stats_route():
+    return jsonify({**ref_cache.stats(), 'artifacts': artifacts.stats()})
+
+# Call after editing licenses, opening shifts or baselines to see the change immediately
+@app.route('/cache_invalidate', methods=['POST'])
+def cache_invalidate_route():
+    name = request.form.get('name') or None
+    # Cached workbooks were built from the old reference data
+    return jsonify({'invalidated': ref_cache.invalidate(name), 'artifacts_removed': artifacts.clear()})
+
+@app.route('/download_excel/<artifact_key>')
+def download_excel(artifact_key):
+    # Workbook of a report page, by artifact key; gone once the artifact expires or is evicted
+    meta = artifacts.lookup(artifact_key) if artifact_key.isalnum() else None
+    workbook = artifacts.open_workbook(artifact_key) if meta is not None else None
+    if workbook is None:
+        return "This report has expired. Please run it again.", 404
+    return send_file(workbook, as_attachment=True, download_name=meta['download_name'])
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=10000)
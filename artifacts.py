@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import query_builder as qb
+import ref_cache
+import snapshot
+
+logger = logging.getLogger(__name__)
+
+# Generated workbooks, keyed by (report, normalized form parameters, data watermark), so an
+# identical request is served from disk and two different requests never share a file.
+# Each artifact is <key>.xlsx plus <key>.json (download name and the page context to render).
+# Reference data in a report is only as fresh as ref_cache, so artifacts live as long.
+ARTIFACT_DIR = os.getenv('ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'artifacts'))
+ARTIFACT_MAX_AGE = int(os.getenv('ARTIFACT_MAX_AGE', ref_cache.REF_CACHE_TTL))  # seconds
+ARTIFACT_MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', 1024 ** 3))
+# Artifacts written this recently are never evicted for size, so the request that built one
+# can still open it
+ARTIFACT_MIN_AGE = int(os.getenv('ARTIFACT_MIN_AGE', 60))  # seconds
+# How long a data watermark lookup is reused before asking MySQL again
+ARTIFACT_WATERMARK_TTL = int(os.getenv('ARTIFACT_WATERMARK_TTL', 60))  # seconds
+
+_watermarks = ref_cache.TTLCache(ttl=ARTIFACT_WATERMARK_TTL, max_entries=8)
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def data_watermark(engine):
+    # Latest UPDATE_DATE of the fact tables: a new FW / cover / closure row changes every key
+    if snapshot.enabled():
+        return snapshot.watermark()
+    key = str(engine.url)
+    watermark = _watermarks.get(key)
+    if watermark is None:
+        row = qb.read_sql(qb.statement(qb.DATA_WATERMARK_SQL), engine).iloc[0]
+        watermark = '|'.join(str(value) for value in row.tolist())
+        _watermarks.set(key, watermark)
+    return watermark
+
+
+def _normalize(params):
+    # Form fields that do not change the report (empty, surrounding blanks) do not change the key
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, '', [], ()):
+            continue
+        normalized[name] = value
+    return normalized
+
+
+def key(kind, params, watermark):
+    payload = json.dumps({'kind': kind, 'params': _normalize(params), 'watermark': watermark},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def path(artifact_key):
+    return os.path.join(ARTIFACT_DIR, f"{artifact_key}.xlsx")
+
+
+def _meta_path(artifact_key):
+    return os.path.join(ARTIFACT_DIR, f"{artifact_key}.json")
+
+
+def lookup(artifact_key):
+    # Sidecar of a live artifact ({'download_name', 'result'}), None if missing or expired
+    try:
+        with open(_meta_path(artifact_key)) as f:
+            meta = json.load(f)
+        mtime = os.path.getmtime(path(artifact_key))
+    except (FileNotFoundError, ValueError):
+        return None
+    if time.time() - mtime > ARTIFACT_MAX_AGE:
+        return None
+    return meta
+
+
+def open_workbook(artifact_key):
+    # The workbook opened for reading, None if it has expired or been evicted. An open file
+    # stays readable when evict() in another request or worker removes it.
+    if lookup(artifact_key) is None:
+        return None
+    try:
+        return open(path(artifact_key), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def _key_lock(artifact_key):
+    with _locks_lock:
+        return _locks.setdefault(artifact_key, threading.Lock())
+
+
+def get_or_build(kind, params, build, download_name, engine):
+    # (key, result) for the report; build(target) writes the workbook and returns a
+    # JSON-serialisable result (e.g. template and context). Exceptions are not cached.
+    artifact_key = key(kind, params, data_watermark(engine))
+    meta = lookup(artifact_key)
+    if meta is not None:
+        logger.info(f"artifact {kind} {artifact_key[:12]} served from cache")
+        return artifact_key, meta['result']
+
+    # Concurrent identical requests in this process wait for one build
+    try:
+        with _key_lock(artifact_key):
+            meta = lookup(artifact_key)
+            if meta is not None:
+                return artifact_key, meta['result']
+            os.makedirs(ARTIFACT_DIR, exist_ok=True)
+            tmp_path = os.path.join(ARTIFACT_DIR, f"{artifact_key}.{uuid.uuid4().hex}.tmp")
+            try:
+                # Rendered in memory (no xlsxwriter temp files) and written to disk once
+                buffer = io.BytesIO()
+                result = build(buffer)
+                with open(tmp_path, 'wb') as f:
+                    f.write(buffer.getbuffer())
+                meta = {'kind': kind, 'download_name': download_name, 'result': result}
+                with open(tmp_path + '.json', 'w') as f:
+                    json.dump(meta, f, default=str)
+                # Workbook first: lookup() needs both, and a sidecar alone is never served
+                os.replace(tmp_path, path(artifact_key))
+                os.replace(tmp_path + '.json', _meta_path(artifact_key))
+            finally:
+                for leftover in (tmp_path, tmp_path + '.json'):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+    finally:
+        # Also after a failed build, or the dict grows with every bad request
+        with _locks_lock:
+            _locks.pop(artifact_key, None)
+    evict()
+    return artifact_key, result
+
+
+def evict():
+    # Drop expired artifacts, then the oldest ones until the directory fits ARTIFACT_MAX_BYTES
+    if not os.path.isdir(ARTIFACT_DIR):
+        return 0
+    now = time.time()
+    entries = []
+    for name in os.listdir(ARTIFACT_DIR):
+        file_path = os.path.join(ARTIFACT_DIR, name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file_path))
+
+    removed = 0
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, file_path in sorted(entries):
+        # Unfinished builds are left alone for an hour
+        stale = now - mtime > (3600 if file_path.endswith('.tmp') else ARTIFACT_MAX_AGE)
+        if not stale and (total <= ARTIFACT_MAX_BYTES or now - mtime < ARTIFACT_MIN_AGE):
+            continue
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"artifacts: evicted {removed} file(s), {total} bytes left")
+    return removed
+
+
+def clear():
+    # Remove every finished artifact (e.g. after reference data was edited)
+    if not os.path.isdir(ARTIFACT_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(ARTIFACT_DIR):
+        if name.endswith(('.xlsx', '.json')):
+            os.remove(os.path.join(ARTIFACT_DIR, name))
+            removed += 1
+    return removed
+
+
+def stats():
+    files = os.listdir(ARTIFACT_DIR) if os.path.isdir(ARTIFACT_DIR) else []
+    return {
+        'artifacts': sum(name.endswith('.xlsx') for name in files),
+        'bytes': sum(os.path.getsize(os.path.join(ARTIFACT_DIR, name)) for name in files
+                     if os.path.exists(os.path.join(ARTIFACT_DIR, name))),
+        'max_bytes': ARTIFACT_MAX_BYTES,
+        'max_age_s': ARTIFACT_MAX_AGE,
+    }
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Matching FW/CV rows to baseline periods without a cartesian merge. Baselines are numbered
+# per kitchen in start order ("baseline N"); rows are located in the chosen baseline's
+# intervals with merge_asof on the sorted start dates, so memory stays linear in the rows
+# however many baselines a kitchen has.
+
+
+def number(baselines, keys):
+    # 'baseline' 1, 2, ... per key in start_date order
+    baselines = baselines.sort_values(list(keys) + ['start_date', 'end_date'], kind='stable')
+    return baselines.assign(baseline=baselines.groupby(list(keys), observed=True, sort=False).cumcount() + 1)
+
+
+def intervals(baselines, keys):
+    # Union of the baselines' [start_date, end_date] per key, as disjoint sorted intervals
+    keys = list(keys)
+    df = baselines[keys + ['start_date', 'end_date']].sort_values(keys + ['start_date'], kind='stable')
+    df = df.reset_index(drop=True)
+    # A new interval where the key's earlier baselines have all ended (NaT on its first one)
+    df['reach'] = df.groupby(keys, observed=True, sort=False)['end_date'].cummax()
+    earlier = df.groupby(keys, observed=True, sort=False)['reach'].shift()
+    interval = (~(df['start_date'] <= earlier)).cumsum()
+    return df.groupby(interval).agg({**{key: 'first' for key in keys}, 'start_date': 'min', 'end_date': 'max'})
+
+
+def period(baselines, keys, n=1):
+    # Baseline n of each key (several kitchens' when their names were merged): first start,
+    # last end and the first of the other columns
+    selected = baselines[baselines['baseline'] == n]
+    others = [column for column in selected.columns if column not in list(keys) + ['start_date', 'end_date', 'baseline']]
+    agg = {'start_date': 'min', 'end_date': 'max', **{column: 'first' for column in others}}
+    return selected.groupby(list(keys), observed=True, sort=False).agg(agg).reset_index()
+
+
+def within(facts, baselines, keys, n=1, date='OPERATION_DATE'):
+    # Boolean mask of the rows of facts whose date falls in baseline n of their key
+    mask = np.zeros(len(facts), dtype=bool)
+    windows = intervals(baselines[baselines['baseline'] == n], keys)
+    if facts.empty or windows.empty:
+        return mask
+    kitchens = pd.MultiIndex.from_frame(windows[list(keys)].astype(object)).unique()
+    left = pd.DataFrame({
+        'kitchen': kitchens.get_indexer(pd.MultiIndex.from_frame(facts[list(keys)].astype(object))),
+        'date': pd.to_datetime(facts[date]).to_numpy(dtype='datetime64[ns]'),
+        'row': np.arange(len(facts)),
+    })
+    left = left[left['kitchen'] >= 0].sort_values('date', kind='stable')
+    right = pd.DataFrame({
+        'kitchen': kitchens.get_indexer(pd.MultiIndex.from_frame(windows[list(keys)].astype(object))),
+        'start_date': windows['start_date'].to_numpy(dtype='datetime64[ns]'),
+        'end_date': windows['end_date'].to_numpy(dtype='datetime64[ns]'),
+    }).sort_values('start_date', kind='stable')
+    # Latest interval of the key starting on or before the date; a hit if it has not ended
+    matched = pd.merge_asof(left, right, left_on='date', right_on='start_date', by='kitchen', direction='backward')
+    mask[matched['row'].to_numpy()] = (matched['date'] <= matched['end_date']).to_numpy()
+    return mask
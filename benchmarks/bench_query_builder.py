@@ -0,0 +1,129 @@
+"""Micro-benchmark: f-string SQL (old queries.py) vs cached bound statements (query_builder).
+
+    python -m benchmarks.bench_query_builder                 # in-memory SQLite fixture
+    python -m benchmarks.bench_query_builder --url mysql+mysqlconnector://...
+"""
+import argparse
+import os
+import sys
+import time
+
+import sqlalchemy
+from sqlalchemy.dialects import mysql
+from sqlalchemy.engine.default import CACHE_HIT
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_builder as qb  # noqa: E402
+
+COMPANIES = ['Hyatt Regency', 'Constance Prince Maurice', 'Courtyard Bangkok', 'Aloft Seoul', 'Andaz Tokyo']
+
+
+# The query exactly as queries.fetch_total_fw used to build it
+def old_total_fw_sql(company_name, start_date, end_date):
+    return f"""
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        kfw.IGD_FOODTYPE_ID,
+        kfw.AMOUNT
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE kfw.ACTIVE = 'Y'
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE '%{company_name}%'
+    AND (kfw.OPERATION_DATE BETWEEN '{start_date}' AND '{end_date}')
+    ORDER BY kfw.OPERATION_DATE
+    """
+
+
+def sqlite_fixture():
+    engine = sqlalchemy.create_engine('sqlite://', poolclass=sqlalchemy.pool.StaticPool)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE COMPANY_PROFILE (CPN_PF_ID INTEGER, COMPANY_NAME TEXT, COMPANY_STATUS TEXT)"))
+        conn.execute(sqlalchemy.text("CREATE TABLE KITCHEN_STATION (KC_STT_ID INTEGER, CPN_PF_ID INTEGER, KICHEN_NAME TEXT, KICHEN_STATUS TEXT, ACTIVE TEXT)"))
+        conn.execute(sqlalchemy.text(
+            "CREATE TABLE KITCHEN_FOOD_WASTE (KC_STT_ID INTEGER, OPERATION_DATE TEXT, SHIFT_ID TEXT, "
+            "IGD_CATEGORY_ID TEXT, IGD_FOODTYPE_ID TEXT, AMOUNT REAL, ACTIVE TEXT)"))
+        for i, name in enumerate(COMPANIES):
+            conn.execute(sqlalchemy.text("INSERT INTO COMPANY_PROFILE VALUES (:i, :n, 'ACTIVE')"), {'i': i, 'n': name})
+            conn.execute(sqlalchemy.text("INSERT INTO KITCHEN_STATION VALUES (:i, :i, 'Main', 'Y', 'Y')"), {'i': i})
+            conn.execute(
+                sqlalchemy.text("INSERT INTO KITCHEN_FOOD_WASTE VALUES (:i, :d, 'LUNCH', 'PREPARATION', 'MEAT', 1.5, 'Y')"),
+                [{'i': i, 'd': f'2024-{m:02d}-{d:02d}'} for m in range(1, 13) for d in range(1, 29)])
+    return engine
+
+
+def requests(n):
+    # Rotate companies and date ranges like real form submissions
+    for i in range(n):
+        month = i % 12 + 1
+        yield COMPANIES[i % len(COMPANIES)], f'2024-{month:02d}-01', f'2024-{month:02d}-28'
+
+
+def bench_compile(n):
+    dialect = mysql.dialect()
+    started = time.perf_counter()
+    for args in requests(n):
+        sqlalchemy.text(old_total_fw_sql(*args)).compile(dialect=dialect)
+    old = time.perf_counter() - started
+
+    # Same statement object every time: compiled once, then looked up by cache key
+    cache = {}
+    started = time.perf_counter()
+    for args in requests(n):
+        stmt, params = qb.total_fw(*args)
+        key = stmt._generate_cache_key().key
+        if key not in cache:
+            cache[key] = stmt.compile(dialect=dialect)
+    new = time.perf_counter() - started
+    return old, new, len(cache)
+
+
+def bench_round_trip(engine, n):
+    results = {}
+    for label in ('old', 'new'):
+        hits = 0
+        started = time.perf_counter()
+        for args in requests(n):
+            with engine.connect() as conn:
+                if label == 'old':
+                    result = conn.execute(sqlalchemy.text(old_total_fw_sql(*args)))
+                else:
+                    stmt, params = qb.total_fw(*args)
+                    result = conn.execute(stmt, params)
+                result.fetchall()
+                hits += result.context.cache_hit == CACHE_HIT
+        results[label] = (time.perf_counter() - started, hits)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', help='database URL (default: in-memory SQLite fixture)')
+    parser.add_argument('-n', '--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(args.url) if args.url else sqlite_fixture()
+    n = args.iterations
+
+    old, new, compiled = bench_compile(n)
+    print(f"compile    old: {old / n * 1e6:8.1f} us/query   new: {new / n * 1e6:8.1f} us/query   "
+          f"({compiled} compiled statement(s) for {n} requests)")
+
+    results = bench_round_trip(engine, n)
+    for label, (seconds, hits) in results.items():
+        print(f"round trip {label}: {seconds / n * 1e6:8.1f} us/query   compiled-cache hits {hits}/{n}")
+
+
+if __name__ == '__main__':
+    main()
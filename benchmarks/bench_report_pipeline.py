@@ -0,0 +1,138 @@
+"""Latency and bytes written per export: temp-file workbooks + send_file vs in-memory / spooled.
+
+    python -m benchmarks.bench_report_pipeline
+    python -m benchmarks.bench_report_pipeline --kitchens 600 --entries 10000 500000
+
+Total FW: a pivot per kitchen (ReportWriter on a path in the temp dir, then read back like
+send_file) vs ReportWriter on a BytesIO (in_memory) written once as the cached artifact.
+Entries: the streaming export with a mkstemp workbook vs report_writer.render (spooled; in
+memory for an export of at most REPORT_IN_MEMORY_ROWS rows, as process_entries does).
+"Written" is wchar from /proc/self/io: bytes handed to write(2), i.e. what reaches the disk
+(or its page cache) and, for the temp-file paths, the xlsxwriter worksheet temp files too.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_writer import REPORT_IN_MEMORY_ROWS, SEND_BLOCK_SIZE, ReportWriter, render  # noqa: E402
+from benchmarks.bench_report_writer import fw_chunks  # noqa: E402
+
+
+def written_bytes():
+    try:
+        with open('/proc/self/io') as f:
+            return int(next(line for line in f if line.startswith('wchar:')).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+
+def total_fw_frames(kitchens):
+    rng = np.random.default_rng(0)
+    foodtypes = ['MEAT', 'SEAFOOD', 'Dairy/Egg', 'Staple food', 'FRUIT', 'VEGETABLE', 'OTHERS']
+    pivot = pd.DataFrame({
+        'COMPANY_NAME': [f"Company {i // 4}" for i in range(kitchens)],
+        'KICHEN_NAME': [f"Kitchen {i}" for i in range(kitchens)],
+    })
+    for foodtype in foodtypes:
+        pivot[foodtype] = rng.random(kitchens) * 1e5
+    pivot['TOTAL'] = pivot[foodtypes].sum(axis=1)
+    pivot['START'] = pd.Timestamp('2024-01-01')
+    pivot['END'] = pd.Timestamp('2024-12-31')
+    plate = pivot[['COMPANY_NAME', 'KICHEN_NAME']].assign(PLATE=rng.random(kitchens) * 1e4)
+    return pivot, plate
+
+
+def drain(f):
+    # What send_file / the streaming response does with the finished workbook
+    sent = 0
+    while block := f.read(SEND_BLOCK_SIZE):
+        sent += len(block)
+    return sent
+
+
+def total_fw_tempfile(pivot, plate, artifact_dir):
+    path = os.path.join(tempfile.gettempdir(), 'bench_Total_FW.xlsx')
+    with ReportWriter(path) as report:
+        report.write('Total_FW_NO_PLATE', pivot)
+        report.write('Total_PLATE', plate)
+    with open(path, 'rb') as f:
+        sent = drain(f)
+    os.remove(path)
+    return sent
+
+
+def total_fw_memory(pivot, plate, artifact_dir):
+    buffer = io.BytesIO()
+    with ReportWriter(buffer) as report:
+        report.write('Total_FW_NO_PLATE', pivot)
+        report.write('Total_PLATE', plate)
+    # The artifact cache keeps one copy on disk; the response is sent from it
+    path = os.path.join(artifact_dir, 'artifact.xlsx')
+    with open(path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    with open(path, 'rb') as f:
+        sent = drain(f)
+    os.remove(path)
+    return sent
+
+
+def entries_build(rows):
+    def build(report):
+        report.write_chunks('FW', fw_chunks(rows, 50_000))
+    return build
+
+
+def entries_tempfile(rows):
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    with ReportWriter(path) as writer:
+        entries_build(rows)(writer)
+    with open(path, 'rb') as f:
+        sent = drain(f)
+    os.remove(path)
+    return sent
+
+
+def entries_spooled(rows):
+    with render(entries_build(rows), in_memory=rows <= REPORT_IN_MEMORY_ROWS) as spool:
+        return drain(spool)
+
+
+def measure(label, fn, *args):
+    before = written_bytes()
+    started = time.perf_counter()
+    sent = fn(*args)
+    elapsed = time.perf_counter() - started
+    after = written_bytes()
+    written = f"{(after - before) / 1e6:8.2f} MB" if before is not None else '     n/a'
+    print(f"{label:28s} {elapsed * 1000:9.1f} ms   written {written}   response {sent / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kitchens', type=int, default=600)
+    parser.add_argument('--entries', type=int, nargs='+', default=[15_000, 200_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pivot, plate = total_fw_frames(args.kitchens)
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        for _ in range(args.repeat):
+            measure('total FW  temp file', total_fw_tempfile, pivot, plate, artifact_dir)
+            measure('total FW  in memory', total_fw_memory, pivot, plate, artifact_dir)
+    for rows in args.entries:
+        for _ in range(args.repeat):
+            measure(f'entries {rows} temp file', entries_tempfile, rows)
+            measure(f'entries {rows} spooled', entries_spooled, rows)
+
+
+if __name__ == '__main__':
+    main()
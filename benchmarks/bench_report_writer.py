@@ -0,0 +1,84 @@
+"""Peak RSS of a 500k-row FW sheet: pd.ExcelWriter on the full frame vs ReportWriter on chunks.
+
+    python -m benchmarks.bench_report_writer
+    python -m benchmarks.bench_report_writer --rows 1000000 --chunksize 50000
+
+Each mode runs in its own child process so ru_maxrss is not shared between them.
+"""
+import argparse
+import datetime
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_writer import ReportWriter  # noqa: E402
+
+MODES = ('pandas', 'report_writer')
+
+
+def fw_chunks(rows, chunksize):
+    # Same columns and value types as the FW sheet of process_entries
+    rng = np.random.default_rng(0)
+    first_day = datetime.date(2024, 1, 1)
+    for start in range(0, rows, chunksize):
+        n = min(chunksize, rows - start)
+        yield pd.DataFrame({
+            'Date': [first_day + datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, n)],
+            'Property': rng.choice(['Hyatt Regency', 'Constance Prince Maurice', 'Aloft Seoul'], n),
+            'Kitchen': rng.choice(['Main', 'Banquet', 'Pastry', 'Staff Canteen'], n),
+            'Shift': rng.choice(['BREAKFAST', 'LUNCH', 'DINNER'], n),
+            'Category': rng.choice(['PREPARATION', 'BUFFET', 'SPOILAGE'], n),
+            'Weight': rng.random(n) * 10,
+            'Type of food': rng.choice(['MEAT', 'Dairy/Egg', 'Staple food', 'FRUIT'], n),
+        })
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run(mode, rows, chunksize):
+    path = tempfile.mktemp(suffix='.xlsx')
+    started = time.perf_counter()
+    if mode == 'pandas':
+        # What the routes did before: one frame, default xlsxwriter options
+        fw = pd.concat(fw_chunks(rows, chunksize), ignore_index=True)
+        with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+            fw.to_excel(writer, sheet_name='FW', index=False)
+    else:
+        with ReportWriter(path) as report:
+            report.write_chunks('FW', fw_chunks(rows, chunksize))
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path)
+    os.remove(path)
+    print(f"{mode:14s} peak RSS {peak_rss_mb():8.1f} MB   {elapsed:6.1f} s   {size / 1e6:6.1f} MB file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.rows, args.chunksize)
+        return
+    print(f"{args.rows} rows, {args.chunksize} rows per chunk")
+    for mode in MODES:
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_report_writer', '--mode', mode,
+                        '--rows', str(args.rows), '--chunksize', str(args.chunksize)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Bytes and latency of the get_savings baseline pull: whole history vs baseline windows in SQL.
+
+    python -m benchmarks.bench_savings_baseline                     # 6-year stand-in in a temp SQLite file
+    python -m benchmarks.bench_savings_baseline --years 10 --kitchens 4
+    python -m benchmarks.bench_savings_baseline --url mysql+mysqlconnector://... --company Hyatt
+
+Without --company it uses the generated company onboarded first (the longest history).
+"Full history" is the baseline query as get_savings ran it before (savings_fwcv without dates),
+"windows" is savings_fwcv(baseline_windows=True). Bytes are the rows as the MySQL text protocol
+sends them (4-byte packet header per row, one length byte plus the text of each value), so
+they are comparable across drivers; latency is execute + fetch, best of --repeat. Both pulls
+are checked to give the same rows once get_savings' baseline merge and filter are applied.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_builder as qb  # noqa: E402
+import synthetic_data  # noqa: E402
+from db import get_engine  # noqa: E402
+
+KEYS = ['COMPANY_NAME', 'KICHEN_NAME']
+
+
+def payload_bytes(rows):
+    return sum(4 + sum(1 if value is None else 1 + len(str(value)) for value in row) for row in rows)
+
+
+def pull(engine, query, params, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            result = conn.execute(query, params)
+            rows = result.fetchall()
+            columns = list(result.keys())
+        times.append(time.perf_counter() - started)
+    return min(times), rows, columns
+
+
+def in_windows(rows, columns, windows):
+    # get_savings' baseline merge and window filter
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    df['OPERATION_DATE'] = pd.to_datetime(df['OPERATION_DATE'])
+    merged = df.merge(windows, on=KEYS, how='inner')
+    merged = merged[(merged['OPERATION_DATE'] >= merged['start_date']) & (merged['OPERATION_DATE'] <= merged['end_date'])]
+    return merged.sort_values(list(merged.columns)).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', help='existing database (default: generate a stand-in in a temp dir)')
+    parser.add_argument('--company', help='company name (LIKE); default the generated company')
+    parser.add_argument('--years', type=float, default=6)
+    parser.add_argument('--companies', type=int, default=5, help='generated companies')
+    parser.add_argument('--kitchens', type=int, default=3, help='mean kitchens per generated company')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url, company = args.url, args.company
+        if url is None:
+            url = f"sqlite:///{os.path.join(tmp, 'standin.sqlite3')}"
+            tables = synthetic_data.generate(companies_count=args.companies, kitchens_per_company=args.kitchens,
+                                             years=args.years)
+            synthetic_data.load(tables, url)
+            # The trial / demo companies come last
+            kitchens = tables['KITCHEN_STATION'].merge(tables['KITCHEN_BASELINE'], on='KC_STT_ID').merge(
+                tables['COMPANY_PROFILE'].head(args.companies), on='CPN_PF_ID')
+            company = company or kitchens.sort_values('BASELINE_START_DATE')['COMPANY_NAME'].iloc[0]
+        engine = get_engine(url)
+
+        query, params = qb.baselines(company_name=company)
+        windows = pd.read_sql_query(query, engine, params=params)
+        windows = windows.rename(columns={'company_name': 'COMPANY_NAME', 'restaurant_name': 'KICHEN_NAME'})
+        windows = windows.drop_duplicates(subset=KEYS + ['start_date', 'end_date'])
+        windows['start_date'] = pd.to_datetime(windows['start_date'])
+        windows['end_date'] = pd.to_datetime(windows['end_date'])
+        print(f"{company}: {windows['KICHEN_NAME'].nunique()} kitchens, {len(windows)} baselines")
+
+        filters = qb.savings_filters(company_name=company)
+        results = {}
+        print(f"{'baseline pull':16s} {'rows':>8s} {'bytes':>12s} {'latency':>10s}")
+        for name, baseline_windows in [('full history', False), ('windows', True)]:
+            query, params = qb.savings_fwcv(filters, baseline_windows=baseline_windows)
+            seconds, rows, columns = pull(engine, query, params, args.repeat)
+            results[name] = in_windows(rows, columns, windows)
+            print(f"{name:16s} {len(rows):8d} {payload_bytes(rows):12d} {seconds * 1000:8.1f} ms")
+        engine.dispose()
+
+    pd.testing.assert_frame_equal(results['full history'], results['windows'])
+    print(f"same {len(results['windows'])} baseline-period rows after the merge")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""get_savings' per-kitchen metrics: separate groupbys merged back one by one vs one pass per key level.
+
+    python -m benchmarks.bench_savings_metrics
+    python -m benchmarks.bench_savings_metrics --kitchens 3000 --days 730
+
+The input is a fleet-wide merged_fwcv (MergeKitchen / MergeComp off): one row per kitchen,
+day and shift after the baseline, with the schema.apply dtypes get_savings works on. "Before"
+is the metric code as get_savings ran it; "after" is calculations.savings_metrics.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculations as calc  # noqa: E402
+import schema  # noqa: E402
+
+KEYS = ['COMPANY_NAME', 'KICHEN_NAME']
+
+
+def fleet(kitchens, days, shifts=3):
+    rng = np.random.default_rng(0)
+    names = pd.DataFrame({
+        'COMPANY_NAME': [f"Company {i // 4}" for i in range(kitchens)],
+        'KICHEN_NAME': [f"Kitchen {i % 4}" for i in range(kitchens)],
+    })
+    baseline_data = names.assign(
+        start_date=pd.Timestamp('2023-01-01'), end_date=pd.Timestamp('2023-01-31'),
+        FWCV=rng.random(kitchens) * 300, COUNTRY_CODE='Unknown')
+    kitchen = np.repeat(np.arange(kitchens), days * shifts)
+    day = np.tile(np.repeat(np.arange(days), shifts), kitchens)
+    rows = len(kitchen)
+    merged_fwcv = pd.DataFrame({
+        'OPERATION_DATE': pd.Timestamp('2023-02-01') + pd.to_timedelta(day, unit='D'),
+        'COMPANY_NAME': names['COMPANY_NAME'].to_numpy()[kitchen],
+        'KICHEN_NAME': names['KICHEN_NAME'].to_numpy()[kitchen],
+        'SHIFT_ID': np.tile(np.array(['BREAKFAST', 'LUNCH', 'DINNER'], dtype=object)[:shifts], kitchens * days),
+        'IGD_CATEGORY_ID': 'PREPARATION',
+        'FW': rng.random(rows) * 20000,
+        'CV': rng.integers(10, 400, rows).astype(float),
+    })
+    merged_fwcv = schema.apply(merged_fwcv)
+    merged_fwcv = merged_fwcv.merge(baseline_data, on=KEYS, how='inner', validate='many_to_one')
+    return merged_fwcv, baseline_data
+
+
+def before(merged_fwcv, baseline_data):
+    # get_savings' metric code before the single pass
+    post_baseline_fwcv = merged_fwcv.groupby(['COMPANY_NAME', 'KICHEN_NAME'], observed=True).agg({'FW': 'sum', 'CV': 'sum'}).reset_index()
+    post_baseline_fwcv['FWCV_post'] = post_baseline_fwcv['FW'] / post_baseline_fwcv['CV']
+    savings_data = post_baseline_fwcv.merge(
+        baseline_data[['COMPANY_NAME', 'KICHEN_NAME', 'FWCV', 'start_date', 'end_date', 'COUNTRY_CODE']],
+        on=['COMPANY_NAME', 'KICHEN_NAME'],
+        how='left'
+    )
+    savings_data['FWCV_variation'] = ((savings_data['FWCV_post'] - savings_data['FWCV']) / savings_data['FWCV']) * 100
+    savings_data['saved food (in kg)'] = (savings_data['FWCV'] - savings_data['FWCV_post']) * savings_data['CV'] / 1000
+
+    daily_fw = merged_fwcv.groupby(['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE'], observed=True).agg({'FW': 'sum'}).reset_index()
+    daily_fw_avg = daily_fw.groupby(['COMPANY_NAME', 'KICHEN_NAME'], observed=True).agg({'FW': 'mean'}).reset_index()
+    daily_fw_avg.rename(columns={'FW': 'daily kg wasted'}, inplace=True)
+    daily_fw_avg['daily kg wasted'] = daily_fw_avg['daily kg wasted'] / 1000
+
+    total_fw = merged_fwcv.groupby(['COMPANY_NAME', 'KICHEN_NAME'], observed=True).agg({'FW': 'sum'}).reset_index()
+    total_fw.rename(columns={'FW': 'kg wasted'}, inplace=True)
+    total_fw['kg wasted'] = total_fw['kg wasted'] / 1000
+
+    total_cv = merged_fwcv.groupby(['COMPANY_NAME', 'KICHEN_NAME'], observed=True).agg({'CV': 'sum'}).reset_index()
+    total_cv.rename(columns={'CV': 'Number of Covers'}, inplace=True)
+
+    savings_data = savings_data.merge(daily_fw_avg, on=['COMPANY_NAME', 'KICHEN_NAME'], how='left')
+    savings_data = savings_data.merge(total_fw, on=['COMPANY_NAME', 'KICHEN_NAME'], how='left')
+    savings_data = savings_data.merge(total_cv, on=['COMPANY_NAME', 'KICHEN_NAME'], how='left')
+    return savings_data
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kitchens', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    merged_fwcv, baseline_data = fleet(args.kitchens, args.days)
+    print(f"{len(merged_fwcv)} post-baseline rows, {args.kitchens} kitchens, {args.days} days")
+
+    old, expected = best(lambda: before(merged_fwcv, baseline_data), args.repeat)
+    new, actual = best(lambda: calc.savings_metrics(merged_fwcv, baseline_data), args.repeat)
+    columns = ['FWCV_post', 'FWCV_variation', 'saved food (in kg)', 'daily kg wasted', 'kg wasted', 'Number of Covers']
+    pd.testing.assert_frame_equal(actual[KEYS + columns], expected[KEYS + columns], check_exact=False, rtol=1e-9)
+    print(f"{'separate groupbys + merges':28s} {old * 1000:8.0f} ms")
+    print(f"{'one pass per key level':28s} {new * 1000:8.0f} ms   ({old / new:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Memory and groupby / merge time of fetched FW rows as the driver returns them vs schema.apply.
+
+    python -m benchmarks.bench_schema
+    python -m benchmarks.bench_schema --rows 2000000 --kitchens 1500
+
+The frame has the get_food_waste_and_covers / total FW shape: object-dtype names, shifts,
+categories and food types, and OPERATION_DATE as datetime.date, as pd.read_sql_query gives them.
+"Before" parses OPERATION_DATE the way the reports did; "after" is the frame schema.apply returns.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schema  # noqa: E402
+
+KEYS = ['COMPANY_NAME', 'KICHEN_NAME']
+
+
+def fetched(rows, kitchens):
+    rng = np.random.default_rng(0)
+    kitchen = rng.integers(0, kitchens, rows)
+    days = pd.date_range('2022-01-01', '2024-12-31')
+    return pd.DataFrame({
+        'OPERATION_DATE': pd.Series(days[rng.integers(0, len(days), rows)].date),
+        'COMPANY_NAME': pd.Series([f"Company {i // 4}" for i in range(kitchens)], dtype=object)[kitchen].to_numpy(),
+        'KICHEN_NAME': pd.Series([f"Kitchen {i % 4} of {i // 4}" for i in range(kitchens)], dtype=object)[kitchen].to_numpy(),
+        'SHIFT_ID': rng.choice(['BREAKFAST', 'BRUNCH', 'LUNCH', 'AFTERNOON_TEA', 'DINNER'], rows).astype(object),
+        'IGD_CATEGORY_ID': rng.choice(['PREPARATION', 'SPOILAGE', 'BUFFET', 'PLATE'], rows).astype(object),
+        'IGD_FOODTYPE_ID': rng.choice(['MEAT', 'SEAFOOD', 'DAIRY', 'STAPLE_FOOD', 'FRUIT', 'VEGETABLE', 'OTHERS'], rows).astype(object),
+        'FW': rng.random(rows) * 5000,
+        'CV': rng.integers(10, 400, rows).astype(float),
+    })
+
+
+def baselines(df):
+    kitchens = df[KEYS].drop_duplicates().reset_index(drop=True)
+    kitchens['start_date'] = pd.Timestamp('2022-01-01')
+    kitchens['end_date'] = pd.Timestamp('2022-03-31')
+    return kitchens
+
+
+def operations(df, baseline):
+    return {
+        'sum per kitchen': lambda: df.groupby(KEYS, observed=True).agg({'FW': 'sum', 'CV': 'sum'}),
+        'sum per kitchen/shift': lambda: df.groupby(KEYS + ['SHIFT_ID'], observed=True).agg({'FW': 'sum', 'CV': 'sum'}),
+        'sum per kitchen/day': lambda: df.groupby(KEYS + ['OPERATION_DATE'], observed=True).agg({'FW': 'sum'}),
+        'pivot food types': lambda: df.pivot_table(index=KEYS, columns='IGD_FOODTYPE_ID', values='FW',
+                                                   aggfunc='sum', observed=True),
+        'merge baselines': lambda: df.merge(baseline, on=KEYS, how='inner'),
+        'unique shifts per day': lambda: df[KEYS + ['OPERATION_DATE', 'SHIFT_ID']].drop_duplicates(),
+    }
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--kitchens', type=int, default=800)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    raw = fetched(args.rows, args.kitchens)
+
+    started = time.perf_counter()
+    before = raw.copy()
+    before['OPERATION_DATE'] = pd.to_datetime(before['OPERATION_DATE'])
+    before_load = time.perf_counter() - started
+    started = time.perf_counter()
+    after = schema.apply(raw.copy())
+    after_load = time.perf_counter() - started
+
+    print(f"{args.rows} rows, {args.kitchens} kitchens")
+    print(f"{'column':28s} {'before MB':>10s} {'after MB':>10s}   dtype")
+    before_memory = before.memory_usage(deep=True, index=False)
+    after_memory = after.memory_usage(deep=True, index=False)
+    for column in raw.columns:
+        print(f"{column:28s} {before_memory[column] / 1e6:10.1f} {after_memory[column] / 1e6:10.1f}   {after[column].dtype}")
+    print(f"{'total':28s} {before_memory.sum() / 1e6:10.1f} {after_memory.sum() / 1e6:10.1f}")
+    print(f"{'load (dates / schema.apply)':28s} {before_load * 1000:8.0f} ms {after_load * 1000:8.0f} ms")
+
+    before_ops = operations(before, baselines(before))
+    after_ops = operations(after, schema.apply(baselines(before)))
+    print(f"\n{'operation':28s} {'before':>10s} {'after':>10s}")
+    for name in before_ops:
+        old, new = best(before_ops[name], args.repeat), best(after_ops[name], args.repeat)
+        print(f"{name:28s} {old * 1000:8.0f} ms {new * 1000:8.0f} ms   ({old / new:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
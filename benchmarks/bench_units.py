@@ -0,0 +1,56 @@
+"""Unit normalization: row-wise DataFrame.apply (old calculations.py) vs units.add_grams.
+
+    python -m benchmarks.bench_units
+    python -m benchmarks.bench_units --rows 5000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import units  # noqa: E402
+
+
+def frame(rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'FW': rng.random(rows) * 5000,
+        'weight_unit': rng.choice(['GRAM', 'KILOGRAM', 'POUND', None], rows, p=[0.6, 0.3, 0.09, 0.01]),
+    })
+
+
+def old_apply(df):
+    # The conversion exactly as get_food_waste_and_covers did it
+    conversion_factors = {
+        'KILOGRAM': 1000,   # kilograms to grams
+        'POUND': 453.592,  # pounds to grams
+        'GRAM': 1         # grams to grams
+    }
+    return df.apply(lambda row: row['FW'] * conversion_factors.get(row['weight_unit'], 1), axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    df = frame(args.rows)
+
+    started = time.perf_counter()
+    old = old_apply(df)
+    old_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    new = units.add_grams(df.copy(), 'FW', 'FW_in_grams')['FW_in_grams']
+    new_s = time.perf_counter() - started
+
+    assert np.allclose(old.to_numpy(dtype='float64'), new.to_numpy())
+    print(f"{args.rows} rows   apply: {old_s:8.3f} s   units.add_grams: {new_s:8.3f} s   ({old_s / new_s:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
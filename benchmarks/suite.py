@@ -0,0 +1,252 @@
+"""Repeatable scenarios over the hot paths: wall time, peak RSS and SQL round trips, as JSON.
+
+    python -m benchmarks.suite --out before.json
+    python -m benchmarks.suite --only dcon --repeat 5 --out after.json
+    python -m benchmarks.suite --compare before.json after.json
+
+Runs against the database configured for the app (.env). Scenarios: DCON for every grouping
+with CONS on and off over a range spanning the July 2024 cutoff, get_savings, g_cover,
+group_by_parent_company, and the report routes through the Flask test client. Runs are cold
+by default (ref_cache and the artifact cache emptied before each one); --warm keeps them.
+Peak RSS is sampled by memory_profiler while the scenario runs; round trips count every
+statement sent to the database (cursor executions), including the fetch pool's.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import psutil
+from memory_profiler import memory_usage
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Workbooks and jobs of the benchmark never mix with the app's own (cleared between runs)
+_scratch = tempfile.mkdtemp(prefix='bench_suite_')
+os.environ.setdefault('ARTIFACT_DIR', os.path.join(_scratch, 'artifacts'))
+os.environ.setdefault('JOBS_DB', os.path.join(_scratch, 'jobs.sqlite3'))
+os.environ.setdefault('JOBS_DIR', os.path.join(_scratch, 'jobs'))
+
+GROUPINGS = ['daily', 'weekly', 'monthly', 'yearly', 'overall']
+
+
+class RoundTrips:
+    # Statements executed on any engine in this process, from every thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+
+def size(result):
+    # Rows of a frame, bytes of a response, None otherwise
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if hasattr(result, 'get_data'):
+        return len(result.get_data())
+    return None
+
+
+def scenarios(args):
+    import app
+    import calculations as calc
+
+    client = app.app.test_client()
+    span = {'start_date': args.start, 'end_date': args.end}
+    company = args.company
+
+    def route(path, form):
+        def call():
+            response = client.post(path, data=form)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+            # The routes report failures as a 200 text page
+            if response.mimetype == 'text/html':
+                body = response.get_data(as_text=True)
+                if body.startswith(('An error occurred', 'An internal error occurred')):
+                    raise RuntimeError(body.splitlines()[0])
+            return response
+        return call
+
+    def dcon(grouping, CONS):
+        return lambda: calc.DCON(engine=app.engine, grouping=grouping, CONS=CONS, company_name=company, **span)
+
+    def parent_companies():
+        # Built once (not timed): company names repeated to a weekly-DCON sized frame
+        names = calc.get_companies()['company_name'].tolist() or ['Hyatt Regency']
+        frame = pd.DataFrame({'COMPANY_NAME': (names * (args.rows // len(names) + 1))[:args.rows]})
+        return lambda: calc.group_by_parent_company(frame.copy())
+
+    found = {}
+    for grouping in GROUPINGS:
+        for CONS in (True, False):
+            found[f"dcon/{grouping}/cons={CONS}"] = lambda g=grouping, c=CONS: dcon(g, c)
+    found['get_savings'] = lambda: lambda: calc.get_savings(company_name=company, **span)
+    found['g_cover/monthly'] = lambda: lambda: calc.g_cover(company_name=company, grouping='monthly', **span)
+    found['group_by_parent_company'] = parent_companies
+    found['route/process_total_fw'] = lambda: route('/process_total_fw', {'company_name': company, **span})
+    found['route/process_entries'] = lambda: route('/process_entries', {'company_name': company, **span})
+    found['route/process_dcon'] = lambda: route('/process_dcon', {'company_name': company, **span})
+    found['route/weekly_results'] = lambda: route('/weekly_results', {'calc_options': 'cons_true', 'parent_company': 'marriott', **span})
+    found['route/process_wdcon'] = lambda: route('/process_wdcon', {'calc_options': 'cons_false', **span})
+    return {name: make for name, make in found.items() if not args.only or any(part in name for part in args.only)}
+
+
+def reset_caches():
+    import artifacts
+    import ref_cache
+    ref_cache.invalidate()
+    artifacts.clear()
+    artifacts._watermarks.invalidate()
+
+
+def run_once(fn, round_trips, cold):
+    if cold:
+        reset_caches()
+    outcome = {}
+
+    def target():
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                outcome['rows'] = size(fn())
+        except Exception as e:
+            outcome['error'] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+
+    rss_before = psutil.Process().memory_info().rss / 2 ** 20
+    trips_before = round_trips.count
+    started = time.perf_counter()
+    peak = memory_usage((target,), interval=0.01, max_usage=True, max_iterations=1)
+    wall = time.perf_counter() - started
+    return {
+        'wall_s': round(wall, 4),
+        'peak_rss_mb': round(peak, 1),
+        'rss_delta_mb': round(peak - rss_before, 1),
+        'sql_round_trips': round_trips.count - trips_before,
+        **outcome,
+    }
+
+
+def summarize(runs):
+    ok = [run for run in runs if 'error' not in run]
+    if not ok:
+        return {'error': runs[-1]['error']}
+    walls = [run['wall_s'] for run in ok]
+    return {
+        'wall_s_min': min(walls),
+        'wall_s_median': round(statistics.median(walls), 4),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in ok),
+        'rss_delta_mb': max(run['rss_delta_mb'] for run in ok),
+        'sql_round_trips': ok[0]['sql_round_trips'],
+        'rows': ok[0].get('rows'),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # The per-query fetch logs would dominate the output
+    logging.disable(logging.INFO)
+    round_trips = RoundTrips()
+    results = {}
+    for name, make in scenarios(args).items():
+        try:
+            fn = make()
+        except Exception as e:
+            results[name] = {'runs': [], 'summary': {'error': f"setup: {type(e).__name__}: {e}"}}
+            print(f"{name:36s} setup failed: {e}", file=sys.stderr)
+            continue
+        runs = [run_once(fn, round_trips, cold=not args.warm) for _ in range(args.repeat)]
+        results[name] = {'runs': runs, 'summary': summarize(runs)}
+        summary = results[name]['summary']
+        if 'error' in summary:
+            print(f"{name:36s} error: {summary['error']}", file=sys.stderr)
+        else:
+            print(f"{name:36s} {summary['wall_s_median']:8.3f} s  peak {summary['peak_rss_mb']:8.1f} MB  "
+                  f"(+{summary['rss_delta_mb']:.1f})  {summary['sql_round_trips']:4d} queries", file=sys.stderr)
+
+    from db import database_url
+    from sqlalchemy.engine import make_url
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'database': make_url(database_url()).render_as_string(hide_password=True),
+            'company': args.company, 'start_date': args.start, 'end_date': args.end,
+            'repeat': args.repeat, 'cold': not args.warm,
+        },
+        'results': results,
+    }
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    print(f"{'scenario':36s} {'wall base':>10s} {'wall new':>10s} {'ratio':>7s} {'peak base':>10s} {'peak new':>10s} "
+          f"{'queries':>9s}")
+    for name in sorted(set(base) | set(new)):
+        a = base.get(name, {}).get('summary', {})
+        b = new.get(name, {}).get('summary', {})
+        if 'wall_s_median' not in a or 'wall_s_median' not in b:
+            print(f"{name:36s} {'(missing or failed in one run)':>40s}")
+            continue
+        ratio = b['wall_s_median'] / a['wall_s_median'] if a['wall_s_median'] else float('nan')
+        print(f"{name:36s} {a['wall_s_median']:9.3f}s {b['wall_s_median']:9.3f}s {ratio:6.2f}x "
+              f"{a['peak_rss_mb']:8.1f}MB {b['peak_rss_mb']:8.1f}MB {a['sql_round_trips']:4d}->{b['sql_round_trips']:<4d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--company', default=os.getenv('BENCH_COMPANY', 'Hyatt'),
+                        help='company name (LIKE match) for the per-company scenarios')
+    parser.add_argument('--start', default='2024-04-01', help='first day (default spans the July 2024 cutoff)')
+    parser.add_argument('--end', default='2024-09-30')
+    parser.add_argument('--only', nargs='+', help='run scenarios whose name contains any of these')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warm', action='store_true', help='keep ref_cache / artifacts between runs')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows for group_by_parent_company')
+    parser.add_argument('--out', help='write the JSON results here (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+    else:
+        json.dump(results, sys.stdout, indent=2, default=str)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+import urllib.parse
+from datetime import date
+from functools import lru_cache
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# Pool settings, overridable from the environment (.env)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # MySQL closes idle connections after wait_timeout
+POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes', 'y')
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class _PoolStats:
+    # Counters for one engine's pool, updated from pool events
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidated = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def incr(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a free connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = _PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record_wait(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+# DATABASE_URL overrides the MySQL settings, e.g. sqlite:///data/standin.sqlite3 for the local
+# stand-in written by synthetic_data.py
+def database_url():
+    if os.getenv('DATABASE_URL'):
+        return os.getenv('DATABASE_URL')
+    user = os.getenv('user')
+    password = os.getenv('password') or ''
+    host = os.getenv('host')
+    database = os.getenv('database')
+
+    # Encode the password to handle special characters
+    encoded_password = urllib.parse.quote_plus(password)
+    return f"mysql+mysqlconnector://{user}:{encoded_password}@{host}/{database}"
+
+
+def _attach_stats(engine):
+    stats = engine.pool.stats
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        stats.incr('connects')
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.incr('checkouts')
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        stats.incr('checkins')
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.incr('invalidated')
+
+
+_DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+@lru_cache(maxsize=None)
+def _dayname(value):
+    # MySQL DAYNAME of a 'YYYY-MM-DD[ HH:MM:SS]' value
+    return _DAY_NAMES[date.fromisoformat(str(value)[:10]).weekday()] if value else None
+
+
+def _attach_sqlite(engine):
+    # What the queries expect from MySQL on a SQLite file: DAYNAME, CURDATE and the
+    # lightblue schema (the same file attached under that name)
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function('DAYNAME', 1, _dayname, deterministic=True)
+        dbapi_connection.create_function('CURDATE', 0, lambda: date.today().isoformat())
+        dbapi_connection.execute('ATTACH DATABASE ? AS lightblue', (engine.url.database,))
+
+
+def get_engine(url=None):
+    # One pooled engine per URL per process, shared by app.py and calculations.py
+    url = url or database_url()
+    key = (url, os.getpid())
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = sqlalchemy.create_engine(
+                url,
+                poolclass=TimedQueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=POOL_PRE_PING,
+            )
+            _attach_stats(engine)
+            metrics.instrument(engine)
+            if engine.dialect.name == 'sqlite':
+                _attach_sqlite(engine)
+            _engines[key] = engine
+    return engine
+
+
+def pool_stats():
+    # Snapshot of pool usage for every engine created in this process
+    stats = []
+    pid = os.getpid()
+    for (url, engine_pid), engine in list(_engines.items()):
+        if engine_pid != pid:
+            continue
+        pool = engine.pool
+        counters = pool.stats
+        with counters.lock:
+            stats.append({
+                'url': engine.url.render_as_string(hide_password=True),
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'connects': counters.connects,
+                'checkouts': counters.checkouts,
+                'checkins': counters.checkins,
+                'invalidated': counters.invalidated,
+                'wait_total_s': round(counters.wait_total, 6),
+                'wait_max_s': round(counters.wait_max, 6),
+                'wait_avg_s': round(counters.wait_total / counters.checkouts, 6) if counters.checkouts else 0.0,
+            })
+    return stats
+
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _after_fork_in_child():
+    # Never share sockets with the parent (e.g. gunicorn --preload): drop inherited
+    # pool entries without closing them so the parent's connections stay valid.
+    # A parent thread may have held the lock at fork time; the child gets a fresh one.
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+    _engines.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+
+from shift_calendar import KEYS, SHIFTS
+
+# DCON inputs fetched once, kept at day level: completed, closed and unscheduled ("extra")
+# shifts per kitchen and day, plus the ShiftCalendar for the scheduled ones. Every grouping
+# (daily / weekly / monthly / yearly / overall, per kitchen or per hotel) is a rollup of
+# the same cube, so a report needing several of them costs one fetch.
+COUNTS = ['COMP_SHIFTS', 'CLOSED_SHIFTS', 'EXTRA_SHIFTS']
+
+
+def _label_columns(grouping):
+    if grouping == 'monthly':
+        return ['YEAR', 'MONTH']
+    elif grouping == 'weekly':
+        return ['WEEK_START_DATE']
+    elif grouping == 'yearly':
+        return ['YEAR']
+    elif grouping == 'daily':
+        return ['OPERATION_DATE']
+    return []
+
+
+def _add_labels(df, grouping):
+    # Period label columns (as in shift_calendar.buckets) from OPERATION_DATE
+    if grouping in ['monthly', 'yearly']:
+        df['YEAR'] = df['OPERATION_DATE'].dt.year
+        if grouping == 'monthly':
+            df['MONTH'] = df['OPERATION_DATE'].dt.month
+    elif grouping == 'weekly':
+        df['WEEK_START_DATE'] = df['OPERATION_DATE'] - pd.to_timedelta(df['OPERATION_DATE'].dt.weekday, unit='D')
+    return df
+
+
+def _consistency(df):
+    consistency = (df['COMP_SHIFTS'] / (df['TOTAL_SHIFTS'] - df['CLOSED_SHIFTS'])).round(2)
+    return consistency.replace([np.inf, -np.inf], 0).fillna(0)
+
+
+class DconCube:
+    def __init__(self, calendar, data, closed_shifts, opening_shifts, licenses):
+        self.calendar = calendar
+        self.licenses = licenses
+        day_keys = KEYS + ['OPERATION_DATE']
+
+        # Shifts with data that are not in the schedule count as scheduled too
+        with metrics.stage('DCON.extra_shifts'):
+            data_shifts = data[day_keys + ['SHIFT_ID']].drop_duplicates()
+            extra_shifts = data_shifts[~calendar.scheduled(data_shifts)]
+
+        # Closures of shifts the kitchen does not open are redundant
+        with metrics.stage('DCON.merge_closures'):
+            closed_shifts = closed_shifts.copy()
+            closed_shifts['DAY_OF_WEEK'] = closed_shifts['OPERATION_DATE'].dt.day_name().str.upper()
+            opening_shifts_melted = opening_shifts.melt(
+                id_vars=['COMPANY_NAME', 'KICHEN_NAME', 'DAY_OF_WEEK'],
+                value_vars=SHIFTS,
+                var_name='SHIFT_ID',
+                value_name='SHIFT_STATUS'
+            )
+            merged_closed_shifts = closed_shifts.merge(
+                opening_shifts_melted,
+                on=['COMPANY_NAME', 'KICHEN_NAME', 'DAY_OF_WEEK', 'SHIFT_ID'],
+                how='left'
+            )
+            status = merged_closed_shifts['SHIFT_STATUS']
+            closed_shifts = merged_closed_shifts[status.notna() & (status != 'N')]
+
+        with metrics.stage('DCON.daily_counts'):
+            counts = [
+                data.groupby(day_keys, observed=True).size().rename('COMP_SHIFTS'),
+                closed_shifts.groupby(day_keys, observed=True).size().rename('CLOSED_SHIFTS'),
+                extra_shifts.groupby(day_keys, observed=True).size().rename('EXTRA_SHIFTS'),
+            ]
+            self.daily = pd.concat(counts, axis=1).fillna(0).astype('int64').reset_index()
+
+    def rollup(self, grouping='overall', PerHotel=False):
+        # DCON at the given grouping, per kitchen (or per company with PerHotel)
+        group_columns = KEYS + _label_columns(grouping)
+        with metrics.stage('DCON.schedule_totals'):
+            total_shifts = self.calendar.totals(grouping)
+
+        daily = _add_labels(self.daily.copy(), grouping)
+        counts = daily.groupby(group_columns, observed=True)[COUNTS].sum().reset_index()
+
+        # Scheduled shifts plus the extra ones; periods with neither are not reported
+        extra = counts.loc[counts['EXTRA_SHIFTS'] > 0, group_columns + ['EXTRA_SHIFTS']].rename(columns={'EXTRA_SHIFTS': 'TOTAL_SHIFTS'})
+        total_shifts = pd.concat([total_shifts, extra], ignore_index=True)
+        total_shifts = total_shifts.groupby(group_columns, observed=True).agg({'TOTAL_SHIFTS': 'sum'}).reset_index()
+
+        dcon_data = total_shifts.merge(counts[group_columns + ['COMP_SHIFTS', 'CLOSED_SHIFTS']], on=group_columns, how='left')
+        dcon_data['COMP_SHIFTS'] = dcon_data['COMP_SHIFTS'].fillna(0)
+        dcon_data['CLOSED_SHIFTS'] = dcon_data['CLOSED_SHIFTS'].fillna(0)
+        dcon_data['CONSISTENCY'] = _consistency(dcon_data)
+
+        # START_DATE / END_DATE: first and last scheduled (or extra) day per kitchen
+        extra_days = self.daily[self.daily['EXTRA_SHIFTS'] > 0]
+        extra_bounds = extra_days.groupby(KEYS, observed=True).agg(
+            START_DATE=('OPERATION_DATE', 'min'),
+            END_DATE=('OPERATION_DATE', 'max')
+        ).reset_index()
+        bounds = pd.concat([self.calendar.bounds(), extra_bounds], ignore_index=True).groupby(KEYS, observed=True).agg(
+            START_DATE=('START_DATE', 'min'),
+            END_DATE=('END_DATE', 'max')
+        ).reset_index()
+        dcon_data = dcon_data.merge(bounds, on=KEYS, how='left')
+
+        # Period columns as DCON returns them
+        if grouping == 'monthly':
+            dcon_data['OPERATION_DATE'] = pd.to_datetime(dcon_data[['YEAR', 'MONTH']].assign(DAY=1))
+            dcon_data = dcon_data.drop(columns=['YEAR', 'MONTH'])
+        elif grouping == 'yearly':
+            dcon_data['OPERATION_DATE'] = pd.to_datetime(dcon_data['YEAR'], format='%Y')
+            dcon_data = dcon_data.drop(columns=['YEAR'])
+
+        columns_to_select = ['COMPANY_NAME', 'KICHEN_NAME']
+        if grouping in ['monthly', 'daily', 'yearly']:
+            columns_to_select.append('OPERATION_DATE')
+        elif grouping == 'weekly':
+            columns_to_select.append('WEEK_START_DATE')
+        columns_to_select += ['CONSISTENCY', 'TOTAL_SHIFTS', 'COMP_SHIFTS', 'CLOSED_SHIFTS']
+        if grouping == 'overall':
+            columns_to_select += ['START_DATE', 'END_DATE']
+
+        licenses = self.licenses
+        if PerHotel:
+            group_cols = [col for col in columns_to_select if col in ('COMPANY_NAME', 'OPERATION_DATE', 'WEEK_START_DATE')]
+            dcon_data = dcon_data.groupby(group_cols, observed=True).agg(
+                TOTAL_SHIFTS=('TOTAL_SHIFTS', 'sum'),
+                COMP_SHIFTS=('COMP_SHIFTS', 'sum'),
+                CLOSED_SHIFTS=('CLOSED_SHIFTS', 'sum'),
+                START_DATE=('START_DATE', 'min'),
+                END_DATE=('END_DATE', 'max'),
+            ).reset_index()
+            dcon_data['CONSISTENCY'] = _consistency(dcon_data)
+            columns_to_select = [col for col in columns_to_select if col != 'KICHEN_NAME']
+            if licenses is not None:
+                licenses = licenses.groupby('COMPANY_NAME', observed=True).agg(
+                    LICENSE_START_DATE=('LICENSE_START_DATE', 'min'),
+                    LICENSE_EXPIRE_DATE=('LICENSE_EXPIRE_DATE', 'max'),
+                ).reset_index()
+
+        dcon_data = dcon_data[columns_to_select]
+        dcon_data = dcon_data.sort_values(by=columns_to_select[:2])
+
+        if licenses is not None:
+            dcon_data = dcon_data.merge(licenses, on=[col for col in KEYS if col in columns_to_select], how='inner')
+        return dcon_data
@@ -0,0 +1,245 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import query_builder as qb
+import schema
+from db import get_engine
+from dummy_kitchens import excluded_kitchens_set
+
+logger = logging.getLogger(__name__)
+
+# Local Parquet table of DCON facts, one row per (kitchen, day, shift) that has a completed
+# FW entry or a closure, so DCON over any range is an in-memory aggregation instead of
+# three MySQL scans. Scheduled shifts are not stored: they come from the opening hours
+# (shift_calendar), which are small reference data. A refresh recomputes only the days
+# with FW / covers / closures written since the last watermark; --full rebuilds a range.
+DCON_STORE_DIR = os.getenv('DCON_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'dcon'))
+DCON_STORE_ENABLED = os.getenv('DCON_STORE_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'y')
+
+# Touched days closer than this are refreshed as one date range (one query each instead of many)
+MERGE_GAP_DAYS = int(os.getenv('DCON_STORE_MERGE_GAP_DAYS', 7))
+
+KEYS = ['COMPANY_NAME', 'KICHEN_NAME', 'OPERATION_DATE', 'SHIFT_ID']
+# COMPLETED: COMPLETE='Y' (new method, and the old method with CONS)
+# COMPLETED_OLD: the pre-cutoff covers / closure / schedule checks (old method without CONS)
+# CLOSED: an active KITCHEN_SHIFT_CLOSE row
+FLAGS = ['COMPLETED', 'COMPLETED_OLD', 'CLOSED']
+
+_refresh_lock = threading.Lock()
+_frame = None
+_frame_lock = threading.Lock()
+
+
+def _path():
+    return os.path.join(DCON_STORE_DIR, 'dcon_facts.parquet')
+
+
+def _meta_path():
+    return os.path.join(DCON_STORE_DIR, 'meta.json')
+
+
+def load_meta():
+    try:
+        with open(_meta_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_atomic(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _save_meta(meta):
+    tmp_path = _meta_path() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2, default=str)
+    os.replace(tmp_path, _meta_path())
+
+
+def _excluded_ids(engine):
+    # Built for the default DCON (Dummies=True): trial / demo kitchens are left out.
+    # Imported here because calculations reads the store.
+    from calculations import resolve_kitchen_ids
+    return resolve_kitchen_ids(excluded_kitchens_set, engine)
+
+
+def _flagged(df, flag):
+    df = df[KEYS].copy()
+    df['OPERATION_DATE'] = pd.to_datetime(df['OPERATION_DATE']).dt.normalize()
+    df = df.drop_duplicates()
+    df[flag] = True
+    return df
+
+
+def _facts(engine, filters, start, end):
+    # The same statements DCON runs, for every company, merged into one flag row per key
+    cutoff = pd.Timestamp(qb.CUTOFF_DATE)
+    day = '%Y-%m-%d'
+    jobs = {
+        'COMPLETED': qb.dcon_data_new(filters, start.strftime(day), end.strftime(day)),
+        'CLOSED': qb.dcon_closed_shifts(filters, start.strftime(day), end.strftime(day)),
+    }
+    if start < cutoff:
+        old_end = min(end, cutoff - timedelta(days=1))
+        jobs['COMPLETED_OLD'] = qb.dcon_data_old(filters, start.strftime(day), old_end.strftime(day), CONS=False)
+    fetched = qb.fetch_all({f"dcon_store.{flag}": job for flag, job in jobs.items()}, engine)
+
+    facts = None
+    for flag in jobs:
+        flagged = _flagged(fetched[f"dcon_store.{flag}"], flag)
+        facts = flagged if facts is None else facts.merge(flagged, on=KEYS, how='outer')
+    for flag in FLAGS:
+        facts[flag] = facts[flag].astype('boolean').fillna(False).astype(bool) if flag in facts else False
+    return facts[KEYS + FLAGS]
+
+
+def _ranges(dates):
+    # Sorted unique days -> [(first, last)] runs, joining runs less than MERGE_GAP_DAYS apart
+    ranges = []
+    for day in sorted(set(dates)):
+        if ranges and (day - ranges[-1][1]).days <= MERGE_GAP_DAYS:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+def _touched_dates(engine, watermark):
+    query, params = qb.dcon_touched_dates(watermark)
+    df = qb.read_sql(query, engine, params)
+    return pd.to_datetime(df['OPERATION_DATE']).dt.normalize().dropna().tolist()
+
+
+def refresh(engine=None, full=False, start_date=None, end_date=None):
+    # Delta refresh by default; full=True rebuilds start_date..end_date (the whole stored
+    # range, or HISTORY_START..today on the first run). Use full after changes that are not
+    # dated: opening hours (old-method checks), kitchen / company status, exclusions.
+    engine = engine or get_engine()
+    os.makedirs(DCON_STORE_DIR, exist_ok=True)
+    with _refresh_lock:
+        meta = load_meta() if available() else {}
+        today = pd.Timestamp(date.today())
+        # Taken before reading, so writes that land during the refresh are picked up next time
+        now = str(qb.read_sql(qb.statement(qb.DB_NOW_SQL), engine)['NOW'].iloc[0])
+        excluded_ids = _excluded_ids(engine)
+
+        if not meta or excluded_ids != meta.get('excluded_ids'):
+            full = True
+            start = pd.Timestamp(start_date or meta.get('start') or qb.HISTORY_START)
+            end = pd.Timestamp(end_date or today)
+            if meta:
+                logger.info("dcon_store: kitchen exclusions changed, rebuilding")
+            meta = {}
+            ranges = [(start, end)]
+        elif full:
+            start = pd.Timestamp(start_date or meta['start'])
+            end = pd.Timestamp(end_date or meta['end'])
+            # Never leave a hole between the stored range and the rebuilt one
+            start = min(start, pd.Timestamp(meta['end']) + timedelta(days=1))
+            end = max(end, pd.Timestamp(meta['start']) - timedelta(days=1))
+            ranges = [(start, end)]
+        else:
+            stored_start, stored_end = pd.Timestamp(meta['start']), pd.Timestamp(meta['end'])
+            touched = [day for day in _touched_dates(engine, meta['watermark']) if stored_start <= day <= today]
+            touched += list(pd.date_range(stored_end + timedelta(days=1), today))
+            ranges = _ranges(touched)
+
+        current = pd.read_parquet(_path()) if meta else pd.DataFrame(columns=KEYS + FLAGS)
+        filters = qb.dcon_filters(excluded_ids=excluded_ids)
+        for first, last in ranges:
+            keep = ~pd.to_datetime(current['OPERATION_DATE']).between(first, last)
+            # Empty frames are left out of the concat so they do not decide the dtypes
+            parts = [part for part in (current[keep], _facts(engine, filters, first, last)) if not part.empty]
+            current = pd.concat(parts, ignore_index=True) if parts else current[keep]
+            logger.info(f"dcon_store: refreshed {first:%Y-%m-%d}..{last:%Y-%m-%d}")
+        if ranges:
+            _write_atomic(current.sort_values(KEYS, ignore_index=True), _path())
+
+        starts = [r[0] for r in ranges] + ([pd.Timestamp(meta['start'])] if meta else [])
+        ends = [r[1] for r in ranges] + ([pd.Timestamp(meta['end'])] if meta else [])
+        meta = {
+            'start': min(starts).strftime('%Y-%m-%d'),
+            'end': max(ends).strftime('%Y-%m-%d'),
+            # A rebuild of part of the range leaves older pending deltas to the next refresh
+            'watermark': meta.get('watermark', now) if full and meta else now,
+            'excluded_ids': excluded_ids,
+            'refreshed_at': datetime.now().isoformat(timespec='seconds'),
+            'rows': len(current),
+            'ranges': [(f"{r[0]:%Y-%m-%d}", f"{r[1]:%Y-%m-%d}") for r in ranges],
+        }
+        _save_meta(meta)
+    return meta
+
+
+def available():
+    return os.path.exists(_path()) and os.path.exists(_meta_path())
+
+
+def enabled():
+    return DCON_STORE_ENABLED and available()
+
+
+def covers(start_date, end_date, excluded_ids):
+    # True when the store holds start_date..end_date, built with the same kitchen exclusions
+    if not enabled():
+        return False
+    meta = load_meta()
+    return (meta.get('excluded_ids') == list(excluded_ids) and
+            pd.Timestamp(meta['start']) <= pd.Timestamp(start_date) and
+            pd.Timestamp(end_date) <= pd.Timestamp(meta['end']))
+
+
+def frame():
+    # Read once per refresh and shared; treat the result as read-only
+    global _frame
+    mtime = os.path.getmtime(_path())
+    with _frame_lock:
+        if _frame is None or _frame[0] != mtime:
+            _frame = (mtime, schema.apply(pd.read_parquet(_path())))
+    return _frame[1]
+
+
+def facts(start_date, end_date, company_name=None, restaurant_name=None):
+    # Stored rows in the range, with the dcon_filters company / restaurant matching
+    df = frame()
+    df = df[df['OPERATION_DATE'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))]
+    if company_name:
+        if isinstance(company_name, list):
+            df = df[df['COMPANY_NAME'].isin(company_name)]
+        else:
+            df = df[df['COMPANY_NAME'].str.contains(company_name, case=False, regex=False, na=False)]
+    if restaurant_name:
+        df = df[df['KICHEN_NAME'].str.contains(restaurant_name, case=False, regex=False, na=False)]
+    return df
+
+
+def dcon_inputs(start_date, end_date, company_name=None, restaurant_name=None, CONS=True):
+    # (closed_shifts, data) as DCON gets them from dcon_closed_shifts / dcon_data_*
+    df = facts(start_date, end_date, company_name, restaurant_name)
+    closed_shifts = df.loc[df['CLOSED'], KEYS].reset_index(drop=True)
+    completed = df['COMPLETED']
+    if not CONS:
+        old = df['OPERATION_DATE'] < pd.Timestamp(qb.CUTOFF_DATE)
+        completed = completed.where(~old, df['COMPLETED_OLD'])
+    data = df.loc[completed, KEYS].reset_index(drop=True)
+    return closed_shifts, data
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Refresh the local DCON completion store from MySQL')
+    parser.add_argument('--full', action='store_true', help='rebuild instead of refreshing the days touched since the watermark')
+    parser.add_argument('--start', help='first day to rebuild (YYYY-MM-DD, with --full)')
+    parser.add_argument('--end', help='last day to rebuild (YYYY-MM-DD, with --full)')
+    args = parser.parse_args()
+    meta = refresh(full=args.full, start_date=args.start, end_date=args.end)
+    print(json.dumps(meta, indent=2, default=str))
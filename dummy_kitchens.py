@@ -0,0 +1,46 @@
+# Old kitchens that are not included in the calculations. Kept apart from calculations so
+# synthetic_data.py can import them without the report code.
+
+trial_kitchens = [
+    ("Crescendo", "Anantara The Palm Dubai"),
+    ("JW Vancouver", "JW Marriott PARQ Vancouver"),
+    ("Hennur", "Geist Brewing Co.")
+]
+
+demo_kitchens = [
+    ("All day dining", "Demo Urban Hotel"),
+    ("SR (Add BL, April)", "Aloft dummy"),
+    ("Silk Road", "Aloft dummy"),
+    ("Deer Hunter", "Constance Belle Mare Plage"),
+    ("Staff Canteen", "Constance Belle Mare Plage"),
+    ("La Spiaggia", "Constance Belle Mare Plage"),
+    ("Indigo", "Constance Belle Mare Plage"),
+    ("La Kaze", "Constance Belle Mare Plage"),
+    ("Blue Penny", "Constance Belle Mare Plage"),
+    ("La Citronelle", "Constance Belle Mare Plage"),
+    ("Le Swing", "Constance Belle Mare Plage"),
+    ("Cafe", "FIT Demo kitchen"),
+    ("All Day Dining", "FIT Demo kitchen"),
+    ("Canteen", "FIT Demo kitchen"),
+    ("CAFE", "FIT Kitchen"),
+    ("CANTEEN", "FIT Kitchen"),
+    ("M ON22", "LIGHTBLUE"),
+    ("Jaafaiy", "LIGHTBLUE"),
+    ("Mamadoo", "Mamadoo Company Limited"),
+    ("0.Bakery", "Demo Convention Center"),
+    ("0.Production", "Demo Convention Center"),
+    ("Buffet", "Demo Convention Center"),
+    ("Coffee Break", "Demo Convention Center"),
+    ("Set Menu", "Demo Convention Center"),
+    
+    # Newly added demo kitchens
+    ("Asian", "Mock Canteen"),
+    ("Main kitchen", "Mock Canteen"),
+    ("Noodle", "Mock Canteen"),
+    ("Salad", "Mock Canteen"),
+    ("Vegetarian", "Mock Canteen"),
+    ("Western", "Mock Canteen"),
+    ("Null kitchen", "Name of Hotel")
+]
+
+excluded_kitchens_set = set(trial_kitchens + demo_kitchens)
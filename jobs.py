@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Long-running reports (DCON over every company, savings) run as background jobs:
+# submit() stores the job in a local SQLite table and hands it to a small worker pool,
+# the browser polls the status and fetches the result when it is done. Queued jobs and
+# jobs whose worker process died are picked up again by start() after a restart.
+JOBS_DB = os.getenv('JOBS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs.sqlite3'))
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        owner_pid INTEGER,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        error TEXT,
+        user_error INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        excel_path TEXT
+    )
+"""
+
+_tasks = {}
+_executor = None
+_lock = threading.Lock()
+_initialized = False
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def task(kind):
+    # Register fn(params, excel_path) -> JSON-serialisable result under a job kind.
+    # fn writes the workbook to excel_path (if it has one) and raises ValueError for
+    # bad parameters; the message is shown to the user as the job error and the job is
+    # flagged user_error, so the result is a 422 rather than a server error.
+    def register(fn):
+        _tasks[kind] = fn
+        return fn
+    return register
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+@contextmanager
+def _connect():
+    # One short-lived autocommit connection per call; SQLite handles the locking between workers
+    global _initialized
+    if not _initialized:
+        with _lock:
+            if not _initialized:
+                os.makedirs(os.path.dirname(JOBS_DB) or '.', exist_ok=True)
+                os.makedirs(JOBS_DIR, exist_ok=True)
+                conn = sqlite3.connect(JOBS_DB, timeout=30)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(SCHEMA)
+                # Tables created before user_error was recorded
+                if 'user_error' not in [column[1] for column in conn.execute('PRAGMA table_info(jobs)')]:
+                    conn.execute('ALTER TABLE jobs ADD COLUMN user_error INTEGER NOT NULL DEFAULT 0')
+                conn.close()
+                _initialized = True
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+def _reset_pool():
+    # Worker threads do not survive fork(); children start a fresh pool
+    global _executor
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def submit(kind, params):
+    if kind not in _tasks:
+        raise ValueError(f"Unknown job type: {kind}")
+    job_id = uuid.uuid4().hex
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), QUEUED, _now()))
+    _pool().submit(_run, job_id)
+    logger.info(f"job {job_id} ({kind}) queued")
+    return job_id
+
+
+def _run(job_id):
+    # Claim the job first: another process recovering the queue may have it already
+    with _connect() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = ?, owner_pid = ?, started_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, os.getpid(), _now(), job_id, QUEUED)).rowcount
+        if not claimed:
+            return
+        row = conn.execute("SELECT kind, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    excel_path = os.path.join(JOBS_DIR, f"{job_id}.xlsx")
+    try:
+        result = _tasks[row['kind']](json.loads(row['params']), excel_path)
+    except Exception as e:
+        if not isinstance(e, ValueError):
+            logger.error(f"job {job_id} ({row['kind']}) failed:\n{traceback.format_exc()}")
+        if os.path.exists(excel_path):
+            os.remove(excel_path)
+        with _connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ?, user_error = ? WHERE id = ?",
+                         (FAILED, _now(), str(e), int(isinstance(e, ValueError)), job_id))
+        return
+
+    with _connect() as conn:
+        conn.execute("UPDATE jobs SET status = ?, finished_at = ?, result = ?, excel_path = ? WHERE id = ?",
+                     (DONE, _now(), json.dumps(result),
+                      excel_path if os.path.exists(excel_path) else None, job_id))
+    logger.info(f"job {job_id} ({row['kind']}) done")
+
+
+def get(job_id):
+    # Job row as a dict (params/result decoded), None if unknown
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['user_error'] = bool(job['user_error'])
+    return job
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def start():
+    # Requeue jobs left running by a dead worker process, drop expired jobs and
+    # dispatch everything queued. Safe to call from every worker process.
+    cutoff = (datetime.now() - timedelta(days=JOB_RETENTION_DAYS)).isoformat(timespec='seconds')
+    with _connect() as conn:
+        for row in conn.execute("SELECT id, owner_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+            if row['owner_pid'] != os.getpid() and not _alive(row['owner_pid']):
+                conn.execute("UPDATE jobs SET status = ?, owner_pid = NULL WHERE id = ? AND status = ?",
+                             (QUEUED, row['id'], RUNNING))
+                logger.info(f"job {row['id']} requeued (worker {row['owner_pid']} is gone)")
+        expired = conn.execute("SELECT id, excel_path FROM jobs WHERE created_at < ? AND status IN (?, ?)",
+                               (cutoff, DONE, FAILED)).fetchall()
+        for row in expired:
+            if row['excel_path'] and os.path.exists(row['excel_path']):
+                os.remove(row['excel_path'])
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row['id'],))
+        queued = [row['id'] for row in conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+    for job_id in queued:
+        _pool().submit(_run, job_id)
+    if queued:
+        logger.info(f"dispatched {len(queued)} queued job(s)")
+
+
+def ensure_started():
+    # start() once in each process that serves requests, on its first one: under
+    # gunicorn --preload the app is imported in the master, which must not run jobs
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid != os.getpid():
+            start()
+            _started_pid = os.getpid()
@@ -0,0 +1,189 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+
+# Latency histograms for SQL statements (by calling function), report stages (the pandas
+# and Excel phases) and routes, served in the Prometheus text format at /metrics. Each
+# process keeps its own (one scrape target per gunicorn worker).
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'y')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds; every histogram also has +Inf
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Modules skipped when looking for the function that ran a query without a caller() tag
+_DATA_ACCESS = {'sqlalchemy', 'pandas', 'metrics', 'db', 'query_builder', 'ref_cache', 'slow_queries',
+                'contextlib', 'concurrent', 'threading'}
+
+_caller = contextvars.ContextVar('metrics_caller', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    # Cumulative buckets, count and sum per label values, updated from any thread
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> [bucket counts, count, sum]
+
+    def observe(self, seconds, *labels):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += seconds
+
+    def expose(self):
+        with self.lock:
+            series = {labels: (list(counts), count, total) for labels, (counts, count, total) in self.series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts + [count - sum(counts)]):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, *labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + 1
+
+    def expose(self):
+        with self.lock:
+            series = dict(self.series)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+query_seconds = Histogram('lbec_query_duration_seconds', 'SQL statement execution time by calling function', ('caller',))
+query_errors = Counter('lbec_query_errors_total', 'SQL statements that raised, by calling function', ('caller',))
+stage_seconds = Histogram('lbec_stage_duration_seconds', 'Report phase time (schedule build, merges, groupbys, Excel)', ('stage',))
+request_seconds = Histogram('lbec_request_duration_seconds', 'Route latency, to the last byte of streamed responses',
+                            ('route', 'method', 'status'))
+REGISTRY = [query_seconds, query_errors, stage_seconds, request_seconds]
+
+
+@contextlib.contextmanager
+def caller(name):
+    # Tag the statements run inside (in this thread) with name, e.g. 'DCON.firstdate'
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    # Time a phase of a report into lbec_stage_duration_seconds{stage=name}
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, name)
+
+
+def current_caller():
+    # The caller() tag, else the innermost function outside the data-access layers
+    name = _caller.get()
+    if name:
+        return name
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__', '').split('.')[0] not in _DATA_ACCESS:
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return 'unknown'
+
+
+def instrument(engine):
+    # Time every statement executed on engine (see db.get_engine)
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append((current_caller(), time.perf_counter()))
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        name, started = conn.info['metrics_started'].pop()
+        query_seconds.observe(time.perf_counter() - started, name)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        pending = context.connection.info.get('metrics_started') if context.connection is not None else None
+        if pending:
+            query_errors.inc(pending.pop()[0])
+
+
+def init_app(app):
+    # Route histograms; streamed responses are timed when the server closes them
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method, str(response.status_code))
+
+        def observe():
+            request_seconds.observe(time.perf_counter() - started, *labels)
+        if response.is_streamed:
+            response.call_on_close(observe)
+        else:
+            observe()
+        return response
+
+
+def expose():
+    # All metrics in the Prometheus text exposition format
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
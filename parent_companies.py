@@ -0,0 +1,61 @@
+import configparser
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Keyword -> parent company mapping, editable without a code change (reloaded when the file changes)
+PARENT_COMPANIES_FILE = os.getenv(
+    'PARENT_COMPANIES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parent_companies.ini'))
+
+_lock = threading.Lock()
+_loaded = (None, None)  # (file mtime, Classifier)
+
+
+def load_mapping(path=PARENT_COMPANIES_FILE):
+    parser = configparser.ConfigParser(interpolation=None, delimiters=('=',))
+    parser.optionxform = str  # keywords are case-sensitive
+    with open(path, encoding='utf-8') as f:
+        parser.read_file(f)
+    return dict(parser['parent_companies'])
+
+
+class Classifier:
+    # One regex for all keywords. The lookahead finds the first keyword (in mapping order)
+    # starting at each position of a name; of those, the earliest in mapping order wins,
+    # the same result as trying each keyword with `in` one after the other.
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.priority = {keyword: i for i, keyword in enumerate(mapping)}
+        alternatives = '|'.join(re.escape(keyword) for keyword in mapping)
+        self.pattern = re.compile(f'(?=({alternatives}))') if mapping else None
+
+    def parent(self, company_name):
+        if self.pattern is None:
+            return company_name
+        matches = self.pattern.findall(company_name)
+        if not matches:
+            return company_name  # Return the original name if no match is found
+        return self.mapping[min(matches, key=self.priority.__getitem__)]
+
+    def classify(self, names):
+        # Evaluated once per distinct name and broadcast back through the factorized codes
+        codes, uniques = pd.factorize(names)
+        parents = np.array([self.parent(name) for name in uniques] + [np.nan], dtype=object)
+        return pd.Series(parents[codes], index=getattr(names, 'index', None))
+
+
+def classifier():
+    global _loaded
+    mtime = os.path.getmtime(PARENT_COMPANIES_FILE)
+    if _loaded[0] != mtime:
+        with _lock:
+            if _loaded[0] != mtime:
+                _loaded = (mtime, Classifier(load_mapping()))
+    return _loaded[1]
+
+
+def classify(names):
+    return classifier().classify(names)
@@ -0,0 +1,1064 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+import metrics
+import schema
+import slow_queries
+
+logger = logging.getLogger(__name__)
+
+# Threads used to run a report's independent queries side by side; keep this at
+# or below DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW (db.py)
+FETCH_WORKERS = int(os.getenv('DB_FETCH_WORKERS', 6))
+_executor = None
+_executor_lock = threading.Lock()
+
+# Every statement here is plain SQL with bound parameters. The text only depends on
+# the *shape* of a request (which filters are present, CONS or not, ...), never on
+# the company, kitchen or dates, so the same TextClause object is reused across
+# requests: SQLAlchemy's compiled cache hits and MySQL sees a stable statement.
+
+# Earliest date of the FW/CV history used by the consistency queries
+HISTORY_START = '2021-03-12'
+
+# Post-July 2024 method switch for DCON / get_savings
+CUTOFF_DATE = '2024-07-01'
+
+
+@lru_cache(maxsize=512)
+def statement(sql, expanding=()):
+    # Cached TextClause for a rendered SQL shape; list parameters are expanding
+    stmt = text(sql)
+    if expanding:
+        stmt = stmt.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    return stmt
+
+
+def read_sql(stmt, engine, params=None):
+    # pd.read_sql_query, with execute, fetch and DataFrame build timed apart for the
+    # slow-query log. Loaded frames get the compact column dtypes of schema.py
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        result = conn.execute(stmt, params or {})
+        executed = time.perf_counter()
+        columns = list(result.keys())
+        data = result.fetchall()
+        context = result.context
+    fetched = time.perf_counter()
+    df = pd.DataFrame.from_records(data, columns=columns, coerce_float=True)
+    built = time.perf_counter()
+    slow_queries.check(engine, stmt, params, context, len(df), executed - started, fetched - executed, built - fetched)
+    return schema.apply(df)
+
+
+def read_sql_chunks(stmt, engine, params=None, chunksize=50000):
+    # Yield DataFrames of at most chunksize rows from a server-side (unbuffered) cursor,
+    # so the full result is never held in memory; always yields at least one frame.
+    # Chunks go straight into a workbook and keep the driver's dtypes (no schema.apply).
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        yield from pd.read_sql_query(stmt, conn, params=params or {}, chunksize=chunksize)
+
+
+def _fetch_pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+    return _executor
+
+
+def _reset_fetch_pool():
+    # Worker threads do not survive fork(); children start a fresh pool
+    global _executor
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_fetch_pool)
+
+
+def _timed_fetch(name, job, engine):
+    started = time.perf_counter()
+    # The statements of the job are timed under its name (metrics.py)
+    with metrics.caller(name):
+        if callable(job):
+            result = job()
+        else:
+            stmt, params = job
+            result = read_sql(stmt, engine, params)
+    elapsed = time.perf_counter() - started
+    rows = len(result) if hasattr(result, '__len__') else 0
+    logger.info(f"fetch {name}: {elapsed:.3f}s, {rows} rows")
+    return result, elapsed
+
+
+def fetch_all(jobs, engine):
+    # Run independent fetches concurrently on the shared, bounded fetch pool.
+    # jobs maps a name to a (statement, params) pair or a zero-argument callable;
+    # returns {name: result}. Each job checks out its own pooled connection, and a
+    # job must not call fetch_all itself (it could wait on its own pool).
+    started = time.perf_counter()
+    futures = {name: _fetch_pool().submit(_timed_fetch, name, job, engine) for name, job in jobs.items()}
+    results = {}
+    timings = {}
+    for name, future in futures.items():
+        results[name], timings[name] = future.result()
+    # Frames fetched together share their categories, so merging them stays categorical
+    schema.align(results.values())
+    if timings:
+        slowest = max(timings, key=timings.get)
+        logger.info(f"fetched {len(jobs)} queries in {time.perf_counter() - started:.3f}s "
+                    f"(critical path: {slowest} {timings[slowest]:.3f}s)")
+    return results
+
+
+class Filters:
+    # Collects extra WHERE conditions and their bound parameters
+    def __init__(self):
+        self.clauses = []
+        self.params = {}
+        self.expanding = []
+
+    def add(self, clause, **params):
+        self.clauses.append(clause)
+        self.params.update(params)
+        return self
+
+    def name(self, column, param, value, like=False):
+        # str -> equality (or LIKE '%value%'), list -> expanding IN
+        if value is None or (isinstance(value, (list, tuple, set)) and not value):
+            return self
+        if isinstance(value, (list, tuple, set)):
+            self.expanding.append(param)
+            return self.add(f"{column} IN :{param}", **{param: list(value)})
+        if like:
+            return self.add(f"{column} LIKE :{param}", **{param: f"%{value}%"})
+        return self.add(f"{column} = :{param}", **{param: value})
+
+    def any_like(self, column, param, values):
+        # (column LIKE :p_0 OR column LIKE :p_1 ...)
+        values = list(values)
+        if not values:
+            return self
+        clauses = [f"{column} LIKE :{param}_{i}" for i in range(len(values))]
+        params = {f"{param}_{i}": f"%{value}%" for i, value in enumerate(values)}
+        return self.add("(" + " OR ".join(clauses) + ")", **params)
+
+    def exclude_kitchen_ids(self, kitchen_ids):
+        # ks.KC_STT_ID NOT IN (...) for kitchens resolved to ids (calculations.resolve_kitchen_ids)
+        kitchen_ids = sorted(kitchen_ids)
+        if not kitchen_ids:
+            return self
+        self.expanding.append('excluded_ids')
+        return self.add("ks.KC_STT_ID NOT IN :excluded_ids", excluded_ids=kitchen_ids)
+
+    def sql(self, prefix=' AND '):
+        # Rendered as ' AND a AND b' so it can follow an existing condition
+        if not self.clauses:
+            return ''
+        return prefix + ' AND '.join(self.clauses)
+
+    def bind(self, sql, **params):
+        # Final (statement, params) pair for pd.read_sql_query
+        merged = dict(self.params)
+        merged.update(params)
+        return statement(sql, tuple(self.expanding)), merged
+
+
+# ---------------------------------------------------------------------------
+# queries.py
+# ---------------------------------------------------------------------------
+
+TOTAL_FW_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        kfw.IGD_FOODTYPE_ID,
+        kfw.AMOUNT
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE kfw.ACTIVE = 'Y'
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND (kfw.OPERATION_DATE BETWEEN :start_date AND :end_date)
+    ORDER BY kfw.OPERATION_DATE
+"""
+
+FW_ENTRIES_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        kfw.AMOUNT,
+        kfw.IGD_FOODTYPE_ID
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE kfw.ACTIVE = 'Y'
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND cp.ACTIVE = 'Y'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND (kfw.OPERATION_DATE BETWEEN :start_date AND :end_date)
+    ORDER BY ks.KICHEN_NAME, kfw.OPERATION_DATE
+"""
+
+CV_ENTRIES_SQL = """
+    SELECT
+        DATE(kc.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kc.SHIFT_ID,
+        kc.AMOUNT
+    FROM
+        KITCHEN_COVER kc
+    JOIN
+        KITCHEN_STATION ks ON kc.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE kc.ACTIVE = 'Y'
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND cp.ACTIVE = 'Y'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND (kc.OPERATION_DATE BETWEEN :start_date AND :end_date)
+    ORDER BY ks.KICHEN_NAME, kc.OPERATION_DATE
+"""
+
+BLPR_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kb.BASELINE_START_DATE,
+        kb.BASELINE_END_DATE
+    FROM
+        COMPANY_PROFILE cp
+    JOIN
+        KITCHEN_STATION ks ON cp.CPN_PF_ID = ks.CPN_PF_ID
+    JOIN
+        KITCHEN_BASELINE kb ON kb.KC_STT_ID = ks.KC_STT_ID
+    WHERE cp.COMPANY_STATUS = 'ACTIVE'
+    AND cp.ACTIVE = 'Y'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    ORDER BY cp.COMPANY_NAME, ks.KICHEN_NAME
+"""
+
+FIRST_DATE_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        MIN(kb.BASELINE_END_DATE) as FirstDate,
+        COUNTRY_CODE
+    FROM COMPANY_PROFILE cp
+    JOIN KITCHEN_STATION ks ON cp.CPN_PF_ID = ks.CPN_PF_ID
+    JOIN KITCHEN_BASELINE kb ON ks.KC_STT_ID = kb.KC_STT_ID
+    WHERE kb.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND cp.ACTIVE = 'Y'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    GROUP BY cp.COMPANY_NAME, ks.KICHEN_NAME
+    ORDER BY cp.COMPANY_NAME, ks.KICHEN_NAME
+"""
+
+# Only shifts that the kitchen schedule marks as open count
+OPEN_SHIFT_SQL = """(
+        (kfw.SHIFT_ID='BREAKFAST' AND kos.BREAKFAST='Y') OR
+        (kfw.SHIFT_ID='LUNCH' AND kos.LUNCH='Y') OR
+        (kfw.SHIFT_ID='DINNER' AND kos.DINNER='Y') OR
+        (kfw.SHIFT_ID='BRUNCH' AND kos.BRUNCH='Y') OR
+        (kfw.SHIFT_ID='AFTERNOON_TEA' AND kos.AFTERNOON_TEA='Y'))"""
+
+FWCV_SQL = f"""
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        SUM(kfw.AMOUNT) as FW,
+        kc.AMOUNT as CV
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        KITCHEN_COVER kc ON kc.KC_STT_ID = ks.KC_STT_ID AND kc.SHIFT_ID = kfw.SHIFT_ID AND kc.OPERATION_DATE = kfw.OPERATION_DATE
+    LEFT JOIN
+        KITCHEN_SHIFT_CLOSE cs ON cs.KC_STT_ID = ks.KC_STT_ID AND cs.SHIFT_ID = kfw.SHIFT_ID AND cs.CLOSE_DATE = kfw.OPERATION_DATE
+    JOIN
+        KITCHEN_OPERATION_SHIFT kos ON kos.KC_STT_ID = ks.KC_STT_ID AND
+        kos.DAY_OF_WEEK = UPPER(DAYNAME(kfw.OPERATION_DATE)) AND
+        kos.OPERATION_SHIFT_TYPE = 'SHIFT_MAIN'
+    WHERE
+        kfw.ACTIVE = 'Y' AND
+        cp.COMPANY_NAME != 'Constance Belle Mare Plage' AND -- Take out CBMP
+        (NOT(kc.AMOUNT IS NULL) OR ks.PRODUCTION_KITCHEN_FLAG='Y') AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        cp.ACTIVE = 'Y' AND
+        cp.COMPANY_NAME LIKE :company_like AND
+        ks.KICHEN_STATUS = 'Y' AND
+        ks.ACTIVE = 'Y' AND
+        (kc.ACTIVE = 'Y' OR kc.ACTIVE IS NULL) AND
+        (cs.ACTIVE IS NULL OR cs.ACTIVE = 'N') AND
+        kfw.OPERATION_DATE BETWEEN :history_start AND :end_date AND
+        {OPEN_SHIFT_SQL}
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME, kfw.OPERATION_DATE, kfw.SHIFT_ID, kfw.IGD_CATEGORY_ID
+"""
+
+CLOSED_SHIFTS_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        ksc.CLOSE_DATE,
+        ksc.SHIFT_ID
+    FROM
+        KITCHEN_SHIFT_CLOSE ksc
+    JOIN
+        COMPANY_PROFILE cp ON cp.CPN_PF_ID = ksc.CPN_PF_ID
+    JOIN
+        KITCHEN_STATION ks ON ks.KC_STT_ID = ksc.KC_STT_ID
+    WHERE ksc.ACTIVE = 'Y'
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND ksc.CLOSE_DATE BETWEEN :history_start AND :end_date
+    ORDER BY cp.COMPANY_NAME, ks.KICHEN_NAME, ksc.CLOSE_DATE
+"""
+
+OPENING_SHIFTS_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kos.DAY_OF_WEEK,
+        kos.BREAKFAST,
+        kos.BRUNCH,
+        kos.LUNCH,
+        kos.AFTERNOON_TEA,
+        kos.DINNER
+    FROM
+        KITCHEN_OPERATION_SHIFT kos
+    JOIN
+        COMPANY_PROFILE cp ON kos.CPN_PF_ID = cp.CPN_PF_ID
+    JOIN
+        KITCHEN_STATION ks ON kos.KC_STT_ID = ks.KC_STT_ID
+    WHERE kos.ACTIVE = 'Y'
+    AND cp.COMPANY_NAME != 'Constance Belle Mare Plage' -- Take out CBMP
+    AND cp.COMPANY_NAME LIKE :company_like
+    AND cp.COMPANY_STATUS = 'ACTIVE'
+    AND cp.ACTIVE = 'Y'
+    AND ks.KICHEN_STATUS = 'Y'
+    AND ks.ACTIVE = 'Y'
+    AND kos.OPERATION_SHIFT_TYPE = 'SHIFT_MAIN'
+    ORDER BY cp.COMPANY_NAME, ks.KICHEN_NAME
+"""
+
+
+def total_fw(company_name, start_date, end_date):
+    return statement(TOTAL_FW_SQL), {'company_like': f"%{company_name}%", 'start_date': start_date, 'end_date': end_date}
+
+
+def fw_entries(company_name, start_date, end_date):
+    return statement(FW_ENTRIES_SQL), {'company_like': f"%{company_name}%", 'start_date': start_date, 'end_date': end_date}
+
+
+def cv_entries(company_name, start_date, end_date):
+    return statement(CV_ENTRIES_SQL), {'company_like': f"%{company_name}%", 'start_date': start_date, 'end_date': end_date}
+
+
+def blpr():
+    return statement(BLPR_SQL), {}
+
+
+def first_date(company_name):
+    return statement(FIRST_DATE_SQL), {'company_like': f"%{company_name}%"}
+
+
+def fwcv(company_name, end_date):
+    return statement(FWCV_SQL), {'company_like': f"%{company_name}%", 'history_start': HISTORY_START, 'end_date': end_date}
+
+
+def closed_shifts(company_name, end_date):
+    return statement(CLOSED_SHIFTS_SQL), {'company_like': f"%{company_name}%", 'history_start': HISTORY_START, 'end_date': end_date}
+
+
+def opening_shifts(company_name):
+    return statement(OPENING_SHIFTS_SQL), {'company_like': f"%{company_name}%"}
+
+
+# ---------------------------------------------------------------------------
+# calculations.py
+# ---------------------------------------------------------------------------
+
+ACTIVE_KITCHEN_SQL = """
+        ks.ACTIVE = 'Y' AND
+        cp.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        ks.KICHEN_STATUS = 'Y'"""
+
+LICENSE_AGGREGATION_SQL = f"""
+    SELECT
+        ks.KICHEN_NAME,
+        cp.COMPANY_NAME,
+        MIN(ca.LICENSE_START_DATE) as LICENSE_START_DATE,
+        MAX(ca.LICENSE_EXPIRE_DATE) as LICENSE_EXPIRE_DATE
+    FROM
+        KITCHEN_STATION ks
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        {ACTIVE_KITCHEN_SQL}
+    GROUP BY
+        ks.KICHEN_NAME, cp.COMPANY_NAME
+"""
+
+KITCHEN_SQL = f"""
+    SELECT
+        ks.KICHEN_NAME as kitchen_name,
+        cp.COMPANY_NAME as company_name,
+        COALESCE(cp.WEEKLY_REPORT_MAIL_TO, cr.WEEKLY_REPORT_EMAIL) as Mail_To,
+        cp.WEEKLY_REPORT_MAIL_CC as Mail_Cc,
+        MIN(ca.LICENSE_START_DATE) as LICENSE_START_DATE,
+        MAX(ca.LICENSE_EXPIRE_DATE) as LICENSE_EXPIRE_DATE
+    FROM
+        KITCHEN_STATION ks
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_REGISTER cr ON cp.CPN_PF_ID = cr.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        {ACTIVE_KITCHEN_SQL}
+        {{conditions}}
+    GROUP BY
+        ks.KICHEN_NAME, cp.COMPANY_NAME, cp.WEEKLY_REPORT_MAIL_TO, cp.WEEKLY_REPORT_MAIL_CC, cr.WEEKLY_REPORT_EMAIL
+"""
+
+KITCHEN_IDS_SQL = """
+    SELECT
+        ks.KC_STT_ID,
+        ks.KICHEN_NAME,
+        cp.COMPANY_NAME
+    FROM
+        KITCHEN_STATION ks
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE
+        ks.KICHEN_NAME IN :kitchen_names
+"""
+
+COMPANIES_SQL = f"""
+    SELECT
+        cp.COMPANY_NAME as company_name,
+        MIN(ca.LICENSE_START_DATE) as LICENSE_START_DATE,
+        MAX(ca.LICENSE_EXPIRE_DATE) as LICENSE_EXPIRE_DATE
+    FROM
+        COMPANY_PROFILE cp
+    JOIN
+        KITCHEN_STATION ks ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        {ACTIVE_KITCHEN_SQL}
+        {{conditions}}
+    GROUP BY cp.COMPANY_NAME
+"""
+
+ALL_INPUT_SQL = """
+    SELECT
+        cp.COMPANY_NAME as company_name,
+        ks.KICHEN_NAME as kitchen_name,
+        kfw.OPERATION_DATE as date,
+        kfw.AMOUNT as input,
+        kfw.SHIFT_ID as shift,
+        kfw.UPDATE_DATE as update_date,
+        kfw.IGD_CATEGORY_ID as category,
+        kfw.IGD_FOODTYPE_ID as food_type,
+        cp.WEIGHT_UNIT_CODE as weight_unit
+    FROM
+        KITCHEN_STATION ks
+    JOIN
+        KITCHEN_FOOD_WASTE kfw ON ks.KC_STT_ID = kfw.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE
+        kfw.OPERATION_DATE BETWEEN :start_date AND :end_date AND
+        kfw.ACTIVE = 'Y'
+        {conditions}
+    ORDER BY kfw.OPERATION_DATE, kfw.SHIFT_ID
+"""
+
+FOOD_WASTE_AND_COVERS_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        kfw.IGD_FOODTYPE_ID,
+        SUM(kfw.AMOUNT) as FW,
+        {cv_amount} as CV,
+        cp.WEIGHT_UNIT_CODE as weight_unit
+    FROM
+        lightblue.KITCHEN_FOOD_WASTE kfw
+    JOIN
+        lightblue.KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        lightblue.COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        lightblue.KITCHEN_COVER kc ON kc.KC_STT_ID = ks.KC_STT_ID AND kc.SHIFT_ID = kfw.SHIFT_ID AND kc.OPERATION_DATE = kfw.OPERATION_DATE
+    LEFT JOIN
+        lightblue.COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        kfw.ACTIVE = 'Y'
+        {conditions} AND
+        kfw.OPERATION_DATE BETWEEN :start_date AND :end_date
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME, kfw.OPERATION_DATE, kfw.SHIFT_ID, kfw.IGD_CATEGORY_ID, kfw.IGD_FOODTYPE_ID{group_by}
+"""
+
+COVERS_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kc.SHIFT_ID,
+        SUM(kc.AMOUNT) as CV
+    FROM
+        lightblue.KITCHEN_FOOD_WASTE kfw
+    JOIN
+        lightblue.KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        lightblue.COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        lightblue.COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    RIGHT JOIN
+        lightblue.KITCHEN_COVER kc ON kc.KC_STT_ID = ks.KC_STT_ID AND kc.SHIFT_ID = kfw.SHIFT_ID AND kc.OPERATION_DATE = kfw.OPERATION_DATE
+    WHERE
+        kfw.ACTIVE = 'Y'
+        {conditions} AND
+        kfw.OPERATION_DATE BETWEEN :start_date AND :end_date
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME{group_by}
+"""
+
+BASELINE_SQL = """
+    SELECT
+        ks.KICHEN_NAME as restaurant_name,
+        cp.COMPANY_NAME as company_name,
+        kb.BASELINE_START_DATE as start_date,
+        kb.BASELINE_END_DATE as end_date
+    FROM
+        KITCHEN_BASELINE kb
+    JOIN
+        KITCHEN_STATION ks ON kb.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        kb.ACTIVE = 'Y' AND
+        cp.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        ks.ACTIVE = 'Y' AND
+        ks.KICHEN_STATUS = 'Y'
+        {conditions}
+    ORDER BY ks.KICHEN_NAME, kb.BASELINE_END_DATE DESC
+"""
+
+POST_BASELINE_SQL = """
+    SELECT
+        ks.KICHEN_NAME as restaurant_name,
+        cp.COMPANY_NAME as company_name,
+        MAX(kb.BASELINE_END_DATE) as baseline_end_date
+    FROM
+        KITCHEN_BASELINE kb
+    JOIN
+        KITCHEN_STATION ks ON kb.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        kb.ACTIVE = 'Y' AND
+        cp.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        ks.ACTIVE = 'Y' AND
+        ks.KICHEN_STATUS = 'Y'
+        {conditions}
+    GROUP BY ks.KICHEN_NAME, cp.COMPANY_NAME
+    ORDER BY ks.KICHEN_NAME, kb.BASELINE_END_DATE DESC
+"""
+
+
+def kitchen_ids(kitchen_names):
+    # Candidate ids for (kitchen, company) pairs; the caller keeps the exact pairs
+    return statement(KITCHEN_IDS_SQL, ('kitchen_names',)), {'kitchen_names': sorted(set(kitchen_names))}
+
+
+def license_aggregation():
+    return statement(LICENSE_AGGREGATION_SQL), {}
+
+
+def kitchens(company_name=None, excluded_ids=(), current_date=None):
+    filters = Filters().name('cp.COMPANY_NAME', 'company_name', company_name)
+    filters.exclude_kitchen_ids(excluded_ids)
+    if current_date is not None:
+        filters.add("ca.LICENSE_EXPIRE_DATE > :current_date", current_date=current_date)
+    return filters.bind(KITCHEN_SQL.format(conditions=filters.sql()))
+
+
+def companies(excluded_ids=()):
+    filters = Filters().exclude_kitchen_ids(excluded_ids)
+    return filters.bind(COMPANIES_SQL.format(conditions=filters.sql()))
+
+
+def all_input(start_date, end_date, kitchen_name=None, excluded_ids=()):
+    filters = Filters().name('ks.KICHEN_NAME', 'kitchen_name', kitchen_name)
+    filters.exclude_kitchen_ids(excluded_ids)
+    return filters.bind(ALL_INPUT_SQL.format(conditions=filters.sql()), start_date=start_date, end_date=end_date)
+
+
+def _upper_filter(filters, column, param, value):
+    if value and value != 'ALL':
+        filters.add(f"{column} = :{param}", **{param: value.upper()})
+
+
+def food_waste_and_covers(start_date, end_date, company_name=None, restaurant_name=None, shift=None, category=None,
+                          food_type=None, CONS=False, cv_amount='kc.AMOUNT', group_by=()):
+    filters = Filters()
+    if CONS:
+        filters.add("kfw.COMPLETE='Y'")
+    filters.name('cp.COMPANY_NAME', 'company_name', company_name)
+    filters.name('ks.KICHEN_NAME', 'restaurant_name', restaurant_name)
+    _upper_filter(filters, 'kfw.SHIFT_ID', 'shift', shift)
+    _upper_filter(filters, 'kfw.IGD_CATEGORY_ID', 'category', category)
+    _upper_filter(filters, 'kfw.IGD_FOODTYPE_ID', 'food_type', food_type)
+    sql = FOOD_WASTE_AND_COVERS_SQL.format(
+        cv_amount=cv_amount,
+        conditions=filters.sql(),
+        group_by=''.join(f", {column}" for column in group_by),
+    )
+    return filters.bind(sql, start_date=start_date, end_date=end_date)
+
+
+def covers(start_date, end_date, company_name=None, restaurant_name=None, shift=None, category=None, food_type=None,
+           CONS=False, excluded_ids=(), license_check=False, group_by=()):
+    filters = Filters()
+    if CONS:
+        filters.add("kfw.COMPLETE='Y'")
+    if company_name:
+        filters.name('cp.COMPANY_NAME', 'company_name', company_name if isinstance(company_name, list) else [company_name])
+    if restaurant_name:
+        filters.name('ks.KICHEN_NAME', 'restaurant_name', restaurant_name if isinstance(restaurant_name, list) else [restaurant_name])
+    _upper_filter(filters, 'kfw.SHIFT_ID', 'shift', shift)
+    _upper_filter(filters, 'kfw.IGD_CATEGORY_ID', 'category', category)
+    _upper_filter(filters, 'kfw.IGD_FOODTYPE_ID', 'food_type', food_type)
+    filters.exclude_kitchen_ids(excluded_ids)
+    if license_check:
+        filters.add("ca.LICENSE_EXPIRE_DATE >= CURDATE()")
+    sql = COVERS_SQL.format(conditions=filters.sql(), group_by=''.join(f", {column}" for column in group_by))
+    return filters.bind(sql, start_date=start_date, end_date=end_date)
+
+
+def baselines(company_name=None, restaurant_name=None, excluded_ids=()):
+    filters = Filters().exclude_kitchen_ids(excluded_ids)
+    if company_name:
+        if isinstance(company_name, list):
+            filters.any_like('cp.COMPANY_NAME', 'company_like', company_name)
+        else:
+            filters.name('cp.COMPANY_NAME', 'company_like', company_name, like=True)
+    filters.name('ks.KICHEN_NAME', 'restaurant_like', restaurant_name or None, like=True)
+    return filters.bind(BASELINE_SQL.format(conditions=filters.sql()))
+
+
+def post_baselines(company_name=None, restaurant_name=None, excluded_ids=()):
+    filters = Filters().exclude_kitchen_ids(excluded_ids)
+    filters.name('cp.COMPANY_NAME', 'company_name', company_name or None)
+    filters.name('ks.KICHEN_NAME', 'restaurant_name', restaurant_name or None)
+    return filters.bind(POST_BASELINE_SQL.format(conditions=filters.sql()))
+
+
+# ---------------------------------------------------------------------------
+# DCON
+# ---------------------------------------------------------------------------
+
+DCON_FIRSTDATE_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        MIN(kb.BASELINE_END_DATE) as FirstDate,
+        COUNTRY_CODE
+    FROM
+        COMPANY_PROFILE cp
+    JOIN
+        KITCHEN_STATION ks ON cp.CPN_PF_ID = ks.CPN_PF_ID
+    JOIN
+        KITCHEN_BASELINE kb ON ks.KC_STT_ID = kb.KC_STT_ID
+    LEFT JOIN
+        COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID
+    WHERE
+        kb.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        cp.ACTIVE = 'Y'
+        {conditions} AND
+        ks.KICHEN_STATUS = 'Y' AND
+        ks.ACTIVE = 'Y'
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME
+    ORDER BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME
+"""
+
+DCON_OPENING_SHIFTS_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kos.DAY_OF_WEEK,
+        kos.BREAKFAST,
+        kos.BRUNCH,
+        kos.LUNCH,
+        kos.AFTERNOON_TEA,
+        kos.DINNER
+    FROM
+        KITCHEN_OPERATION_SHIFT kos
+    JOIN
+        COMPANY_PROFILE cp ON kos.CPN_PF_ID = cp.CPN_PF_ID
+    JOIN
+        KITCHEN_STATION ks ON kos.KC_STT_ID = ks.KC_STT_ID
+    WHERE
+        kos.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE'
+        {conditions} AND
+        cp.ACTIVE = 'Y' AND
+        ks.KICHEN_STATUS = 'Y' AND
+        ks.ACTIVE ='Y' AND
+        kos.OPERATION_SHIFT_TYPE = 'SHIFT_MAIN'
+    ORDER BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME
+"""
+
+DCON_CLOSED_SHIFTS_SQL = """
+    SELECT
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        ksc.CLOSE_DATE as OPERATION_DATE,
+        ksc.SHIFT_ID
+    FROM
+        KITCHEN_SHIFT_CLOSE ksc
+    JOIN
+        COMPANY_PROFILE cp ON cp.CPN_PF_ID = ksc.CPN_PF_ID
+    JOIN
+        KITCHEN_STATION ks ON ks.KC_STT_ID = ksc.KC_STT_ID
+    WHERE
+        ksc.ACTIVE = 'Y' AND
+        cp.COMPANY_STATUS = 'ACTIVE' AND
+        ks.KICHEN_STATUS = 'Y' AND
+        ks.ACTIVE = 'Y'
+        {conditions} AND
+        (ksc.CLOSE_DATE BETWEEN :start_date AND :end_date)
+    ORDER BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME, ksc.CLOSE_DATE
+"""
+
+# Pre-July 2024: a shift counts when FW was entered with covers on a scheduled, non-closed shift
+DCON_OLD_CONSISTENCY_SQL = f"""
+            kc.ACTIVE='Y' AND kfw.ACTIVE = 'Y' AND
+            (NOT(kc.AMOUNT IS NULL) OR ks.PRODUCTION_KITCHEN_FLAG='Y') AND
+            cp.COMPANY_STATUS = 'ACTIVE' AND
+            cp.ACTIVE='Y' AND
+            ks.KICHEN_STATUS = 'Y' AND
+            ks.ACTIVE = 'Y' AND
+            (kc.ACTIVE='Y' OR kc.ACTIVE IS NULL) AND
+            (cs.ACTIVE IS NULL OR cs.ACTIVE='N') AND
+            {OPEN_SHIFT_SQL} AND
+"""
+
+DCON_OLD_JOIN_SQL = """
+            LEFT JOIN KITCHEN_COVER kc ON kc.OPERATION_DATE=kfw.OPERATION_DATE AND kc.SHIFT_ID=kfw.SHIFT_ID AND kc.KC_STT_ID=ks.KC_STT_ID
+            LEFT JOIN KITCHEN_SHIFT_CLOSE cs ON cs.KC_STT_ID = ks.KC_STT_ID AND cs.SHIFT_ID = kfw.SHIFT_ID AND cs.CLOSE_DATE = kfw.OPERATION_DATE
+            JOIN KITCHEN_OPERATION_SHIFT kos ON kos.KC_STT_ID = ks.KC_STT_ID AND kos.DAY_OF_WEEK=UPPER(DAYNAME(kfw.OPERATION_DATE)) AND kos.OPERATION_SHIFT_TYPE='SHIFT_MAIN'
+"""
+
+DCON_OLD_DATA_SQL = """
+    SELECT
+        kfw.OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        SUM(kfw.AMOUNT) as FW,
+        SUM(kc_main.AMOUNT) as CV
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    LEFT JOIN
+        KITCHEN_COVER kc_main ON kc_main.KC_STT_ID = ks.KC_STT_ID AND kc_main.SHIFT_ID = kfw.SHIFT_ID AND kc_main.OPERATION_DATE = kfw.OPERATION_DATE
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    {join_cover}
+    WHERE
+        kfw.ACTIVE = 'Y'
+        {conditions} AND
+        {consistency}
+        kfw.OPERATION_DATE BETWEEN :start_date AND :end_date
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME, kfw.OPERATION_DATE, kfw.SHIFT_ID
+"""
+
+DCON_NEW_DATA_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID
+    FROM
+        KITCHEN_FOOD_WASTE kfw
+    JOIN
+        KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    WHERE
+        kfw.ACTIVE = 'Y'
+        {conditions} AND
+        kfw.COMPLETE='Y' AND
+        kfw.OPERATION_DATE BETWEEN :start_date AND :end_date
+    GROUP BY
+        cp.COMPANY_NAME, ks.KICHEN_NAME, kfw.OPERATION_DATE, kfw.SHIFT_ID
+"""
+
+
+def dcon_filters(company_name=None, restaurant_name=None, excluded_ids=()):
+    # Company list -> exact names, single company / restaurant -> LIKE '%name%'
+    filters = Filters()
+    if company_name:
+        if isinstance(company_name, list):
+            filters.name('cp.COMPANY_NAME', 'company_names', company_name)
+        else:
+            filters.name('cp.COMPANY_NAME', 'company_like', company_name, like=True)
+    if restaurant_name:
+        filters.name('ks.KICHEN_NAME', 'restaurant_like', restaurant_name, like=True)
+    filters.exclude_kitchen_ids(excluded_ids)
+    return filters
+
+
+def dcon_firstdate(filters):
+    return filters.bind(DCON_FIRSTDATE_SQL.format(conditions=filters.sql()))
+
+
+def dcon_opening_shifts(filters):
+    return filters.bind(DCON_OPENING_SHIFTS_SQL.format(conditions=filters.sql()))
+
+
+def dcon_closed_shifts(filters, start_date, end_date):
+    return filters.bind(DCON_CLOSED_SHIFTS_SQL.format(conditions=filters.sql()), start_date=start_date, end_date=end_date)
+
+
+def dcon_data_old(filters, start_date, end_date, CONS=True):
+    # CONS only needs the completion flag; otherwise check covers/closures/schedule
+    if CONS:
+        consistency, join_cover = "kfw.COMPLETE='Y' AND", ''
+    else:
+        consistency, join_cover = DCON_OLD_CONSISTENCY_SQL, DCON_OLD_JOIN_SQL
+    sql = DCON_OLD_DATA_SQL.format(conditions=filters.sql(), consistency=consistency, join_cover=join_cover)
+    return filters.bind(sql, start_date=start_date, end_date=end_date)
+
+
+def dcon_data_new(filters, start_date, end_date):
+    return filters.bind(DCON_NEW_DATA_SQL.format(conditions=filters.sql()), start_date=start_date, end_date=end_date)
+
+
+# Operation dates with FW, covers or closures written since the watermark (dcon_store delta refresh)
+DCON_TOUCHED_DATES_SQL = """
+    SELECT DATE(OPERATION_DATE) as OPERATION_DATE FROM KITCHEN_FOOD_WASTE WHERE UPDATE_DATE >= :watermark
+    UNION
+    SELECT DATE(OPERATION_DATE) FROM KITCHEN_COVER WHERE UPDATE_DATE >= :watermark
+    UNION
+    SELECT DATE(CLOSE_DATE) FROM KITCHEN_SHIFT_CLOSE WHERE UPDATE_DATE >= :watermark
+"""
+
+DB_NOW_SQL = "SELECT CURRENT_TIMESTAMP as NOW"
+
+# Latest write to the fact tables; part of every report artifact key (artifacts.py)
+DATA_WATERMARK_SQL = """
+    SELECT
+        (SELECT MAX(UPDATE_DATE) FROM KITCHEN_FOOD_WASTE) as FW,
+        (SELECT MAX(UPDATE_DATE) FROM KITCHEN_COVER) as CV,
+        (SELECT MAX(UPDATE_DATE) FROM KITCHEN_SHIFT_CLOSE) as CLOSED
+"""
+
+
+def dcon_touched_dates(watermark):
+    return statement(DCON_TOUCHED_DATES_SQL), {'watermark': watermark}
+
+
+# ---------------------------------------------------------------------------
+# get_savings
+# ---------------------------------------------------------------------------
+
+SAVINGS_OLD_CALC_SQL = f"""((kfw.COMPLETE='Y' AND DATE(kfw.OPERATION_DATE) >= '{CUTOFF_DATE}') OR
+            (DATE(kfw.OPERATION_DATE) < '{CUTOFF_DATE}' AND
+            cp.COMPANY_STATUS='ACTIVE' AND
+            cp.ACTIVE='Y' AND
+            ks.KICHEN_STATUS='Y' AND
+            ks.ACTIVE='Y' AND
+            (kc.ACTIVE='Y' OR kc.ACTIVE IS NULL) AND
+            (cs.ACTIVE IS NULL OR cs.ACTIVE='N') AND
+            {OPEN_SHIFT_SQL}))"""
+
+SAVINGS_FWCV_SQL = """
+    SELECT
+        DATE(kfw.OPERATION_DATE) as OPERATION_DATE,
+        cp.COMPANY_NAME,
+        ks.KICHEN_NAME,
+        kfw.SHIFT_ID,
+        kfw.IGD_CATEGORY_ID,
+        SUM(kfw.AMOUNT) as FW,
+        kc.AMOUNT as CV
+    FROM
+        lightblue.KITCHEN_FOOD_WASTE kfw
+    JOIN
+        lightblue.KITCHEN_STATION ks ON kfw.KC_STT_ID = ks.KC_STT_ID
+    JOIN
+        lightblue.COMPANY_PROFILE cp ON ks.CPN_PF_ID = cp.CPN_PF_ID
+    LEFT JOIN
+        KITCHEN_COVER kc ON kc.KC_STT_ID = ks.KC_STT_ID AND kc.SHIFT_ID = kfw.SHIFT_ID AND kc.OPERATION_DATE = kfw.OPERATION_DATE
+    LEFT JOIN
+        lightblue.KITCHEN_SHIFT_CLOSE cs ON cs.KC_STT_ID = ks.KC_STT_ID AND cs.SHIFT_ID = kfw.SHIFT_ID AND cs.CLOSE_DATE = kfw.OPERATION_DATE
+    {license_join}
+    JOIN
+        lightblue.KITCHEN_OPERATION_SHIFT kos ON kos.KC_STT_ID=ks.KC_STT_ID AND kos.DAY_OF_WEEK=UPPER(DAYNAME(kfw.OPERATION_DATE)) AND kos.OPERATION_SHIFT_TYPE='SHIFT_MAIN'
+    WHERE
+        {conditions}
+    GROUP BY
+        cp.COMPANY_NAME{kitchen_column}, kfw.OPERATION_DATE, kfw.SHIFT_ID
+"""
+
+
+def savings_filters(CONS=False, company_name=None, restaurant_name=None, shift=None, category=None, foodtype=None,
+                    excluded_ids=(), Expired=False, with_old_calc=False):
+    filters = Filters().add("kfw.ACTIVE = 'Y'")
+    filters.add(f"({SAVINGS_OLD_CALC_SQL})" if with_old_calc else "(kfw.COMPLETE='Y')")
+    filters.exclude_kitchen_ids(excluded_ids)
+    if CONS:
+        filters.add("kfw.COMPLETE='Y'")
+    filters.name('cp.COMPANY_NAME', 'company_like', company_name or None, like=True)
+    filters.name('ks.KICHEN_NAME', 'restaurant_like', restaurant_name or None, like=True)
+    _upper_filter(filters, 'kfw.SHIFT_ID', 'shift', shift)
+    _upper_filter(filters, 'kfw.IGD_CATEGORY_ID', 'category', category)
+    _upper_filter(filters, 'kfw.IGD_FOODTYPE_ID', 'foodtype', foodtype)
+    if Expired:
+        filters.add('ca.LICENSE_EXPIRE_DATE >= CURDATE()')
+    filters.add("kc.ACTIVE='Y'")
+    return filters
+
+
+# Baseline pull restricted on the server to rows inside a kitchen's active baseline. The
+# kitchen's own windows are an index range on KITCHEN_BASELINE; stations sharing a company and
+# kitchen name with another one (get_savings merges baselines on those names) and merged
+# kitchens / companies keep every window the merge can use. get_savings still applies the
+# exact window per baseline in pandas.
+SAVINGS_KITCHEN_WINDOW_SQL = """
+    (EXISTS (
+        SELECT 1
+        FROM
+            lightblue.KITCHEN_BASELINE bkb
+        WHERE
+            bkb.KC_STT_ID = kfw.KC_STT_ID AND
+            bkb.ACTIVE = 'Y' AND
+            kfw.OPERATION_DATE BETWEEN bkb.BASELINE_START_DATE AND bkb.BASELINE_END_DATE
+    ) OR ks.KC_STT_ID IN (
+        SELECT
+            sks.KC_STT_ID
+        FROM
+            lightblue.KITCHEN_STATION sks
+        JOIN
+            lightblue.COMPANY_PROFILE scp ON sks.CPN_PF_ID = scp.CPN_PF_ID
+        JOIN (
+            SELECT dcp.COMPANY_NAME, dks.KICHEN_NAME
+            FROM lightblue.KITCHEN_STATION dks
+            JOIN lightblue.COMPANY_PROFILE dcp ON dks.CPN_PF_ID = dcp.CPN_PF_ID
+            GROUP BY dcp.COMPANY_NAME, dks.KICHEN_NAME
+            HAVING COUNT(*) > 1
+        ) shared ON shared.COMPANY_NAME = scp.COMPANY_NAME AND shared.KICHEN_NAME = sks.KICHEN_NAME
+    ))
+"""
+
+SAVINGS_MERGED_WINDOW_SQL = """
+    EXISTS (
+        SELECT 1
+        FROM
+            lightblue.KITCHEN_BASELINE bkb
+        JOIN
+            lightblue.KITCHEN_STATION bks ON bkb.KC_STT_ID = bks.KC_STT_ID
+        JOIN
+            lightblue.COMPANY_PROFILE bcp ON bks.CPN_PF_ID = bcp.CPN_PF_ID
+        WHERE
+            bkb.ACTIVE = 'Y' AND
+            bcp.ACTIVE = 'Y' AND
+            bcp.COMPANY_STATUS = 'ACTIVE' AND
+            bks.ACTIVE = 'Y' AND
+            bks.KICHEN_STATUS = 'Y' AND
+            kfw.OPERATION_DATE BETWEEN bkb.BASELINE_START_DATE AND bkb.BASELINE_END_DATE
+            {match}
+    )
+"""
+
+
+def savings_fwcv(filters, start_date=None, end_date=None, MergeKitchen=False, Expired=False,
+                 baseline_windows=False, MergeComp=False):
+    # baseline_windows restricts to baseline periods on the server (the baseline pull);
+    # without it or dates this is the kitchens' full history
+    conditions = filters.sql(prefix='')
+    params = {}
+    if start_date is not None or end_date is not None:
+        conditions += " AND kfw.OPERATION_DATE BETWEEN :start_date AND :end_date"
+        params = {'start_date': start_date, 'end_date': end_date}
+    if baseline_windows and not (MergeKitchen or MergeComp):
+        conditions += " AND " + SAVINGS_KITCHEN_WINDOW_SQL.strip()
+    elif baseline_windows:
+        # Merged rows count in any window of the company (MergeKitchen) or of that kitchen name (MergeComp)
+        match = '' if MergeComp else ' AND bcp.COMPANY_NAME = cp.COMPANY_NAME'
+        if not MergeKitchen:
+            match += ' AND bks.KICHEN_NAME = ks.KICHEN_NAME'
+        conditions += " AND " + SAVINGS_MERGED_WINDOW_SQL.format(match=match).strip()
+    sql = SAVINGS_FWCV_SQL.format(
+        conditions=conditions,
+        kitchen_column='' if MergeKitchen else ', ks.KICHEN_NAME',
+        license_join="LEFT JOIN lightblue.COMPANY_ACTIVATE ca ON ks.CPN_PF_ID = ca.CPN_PF_ID" if Expired else '',
+    )
+    return filters.bind(sql, **params)
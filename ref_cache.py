@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import query_builder as qb
+
+# Reference data (licenses, opening shift schedules, first baseline dates) changes a
+# few times a week, so it is kept in-process instead of re-queried for every report.
+REF_CACHE_TTL = int(os.getenv('REF_CACHE_TTL', 6 * 3600))  # seconds
+REF_CACHE_MAX_ENTRIES = int(os.getenv('REF_CACHE_MAX_ENTRIES', 256))
+
+
+class TTLCache:
+    # Thread-safe LRU mapping whose entries expire ttl seconds after being stored
+    def __init__(self, ttl=REF_CACHE_TTL, max_entries=REF_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, name=None):
+        # Drop every entry, or only those stored under one name (e.g. 'licenses')
+        with self.lock:
+            if name is None:
+                removed = len(self.entries)
+                self.entries.clear()
+                return removed
+            keys = [key for key in self.entries if key[0] == name]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+cache = TTLCache()
+
+
+def _freeze(params):
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value) for key, value in params.items()))
+
+
+def read_sql(name, stmt, engine, params=None):
+    # qb.read_sql through the cache; callers get their own copy to modify
+    params = params or {}
+    key = (name, str(engine.url), stmt.text, _freeze(params))
+    df = cache.get(key)
+    if df is None:
+        df = qb.read_sql(stmt, engine, params)
+        cache.set(key, df)
+    return df.copy()
+
+
+def job(name, query, engine):
+    # Zero-argument callable for qb.fetch_all from a (statement, params) pair
+    stmt, params = query
+    return lambda: read_sql(name, stmt, engine, params)
+
+
+def invalidate(name=None):
+    return cache.invalidate(name)
+
+
+def stats():
+    return cache.stats()
@@ -0,0 +1,153 @@
+import io
+import logging
+import os
+import tempfile
+import unicodedata
+from urllib.parse import quote
+
+import pandas as pd
+import xlsxwriter
+from flask import Response, stream_with_context
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Bytes per block when sending a finished workbook
+SEND_BLOCK_SIZE = 64 * 1024
+
+# Finished workbooks up to this size are assembled in memory; bigger ones spill to an
+# anonymous temp file that disappears when it is closed
+REPORT_SPOOL_BYTES = int(os.getenv('REPORT_SPOOL_BYTES', 32 * 1024 * 1024))
+# Exports with at most this many rows skip the constant_memory worksheet temp files
+REPORT_IN_MEMORY_ROWS = int(os.getenv('REPORT_IN_MEMORY_ROWS', 20000))
+
+# Cell formats, created once per workbook and applied per column from the dtype
+FORMATS = {
+    'header': {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'},
+    'date': {'num_format': 'yyyy-mm-dd'},
+    'float': {'num_format': '0.00'},
+}
+COLUMN_WIDTHS = {'date': 12}
+
+
+def column_kind(series):
+    # Which entry of FORMATS a column uses (None = Excel's General format)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'date'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    first = series.first_valid_index()
+    if series.dtype == object and first is not None and hasattr(series[first], 'isoformat'):
+        # DATE(...) columns come back from MySQL as datetime.date objects
+        return 'date'
+    return None
+
+
+class ReportWriter:
+    # xlsxwriter workbook in constant_memory mode: each row is flushed to a per-sheet
+    # temp file as soon as the next one starts, so memory stays flat however many
+    # chunks are appended. Rows of a sheet must be written in order.
+    # in_memory (the default for a BytesIO target) keeps the cells in memory instead and
+    # writes no temp files at all; meant for the small, already aggregated reports.
+    def __init__(self, target, in_memory=None):
+        if in_memory is None:
+            in_memory = isinstance(target, io.BytesIO)
+        options = {'default_date_format': FORMATS['date']['num_format']}
+        if in_memory:
+            options['in_memory'] = True
+        else:
+            options.update({'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        self.workbook = xlsxwriter.Workbook(target, options)
+        self.formats = {}
+        self.sheets = {}  # sheet name -> [worksheet, next row]
+
+    def format(self, kind):
+        if kind not in self.formats:
+            self.formats[kind] = self.workbook.add_format(FORMATS[kind])
+        return self.formats[kind]
+
+    def _sheet(self, sheet_name, df):
+        # The first chunk of a sheet writes the header and fixes the column formats
+        if sheet_name not in self.sheets:
+            worksheet = self.workbook.add_worksheet(sheet_name)
+            for col, name in enumerate(df.columns):
+                worksheet.write_string(0, col, str(name), self.format('header'))
+                kind = column_kind(df[name])
+                if kind:
+                    worksheet.set_column(col, col, COLUMN_WIDTHS.get(kind), self.format(kind))
+            self.sheets[sheet_name] = [worksheet, 1]
+        return self.sheets[sheet_name]
+
+    def write(self, sheet_name, df):
+        # Append a DataFrame below the rows already in the sheet; returns the rows written
+        with metrics.stage('excel.write'):
+            entry = self._sheet(sheet_name, df)
+            worksheet, row = entry
+            values = df.astype(object).where(df.notna(), None)
+            for record in values.itertuples(index=False, name=None):
+                worksheet.write_row(row, 0, record)
+                row += 1
+            entry[1] = row
+        return len(df)
+
+    def write_chunks(self, sheet_name, chunks):
+        # Write an iterator of DataFrames into one sheet; returns the total rows written
+        return sum(self.write(sheet_name, chunk) for chunk in chunks)
+
+    def close(self):
+        # Assembling the .xlsx (zip of the sheets) happens here
+        with metrics.stage('excel.close'):
+            self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render(build, in_memory=False):
+    # Workbook filled by build(writer), as a rewound spooled file: in memory up to
+    # REPORT_SPOOL_BYTES, never a named file on disk. The caller closes it.
+    spool = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES, suffix='.xlsx')
+    try:
+        with ReportWriter(spool, in_memory=in_memory) as writer:
+            build(writer)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def send_report(build, download_name, in_memory=False):
+    # Streaming download: the response (headers) starts before any row is fetched,
+    # build(writer) fills the workbook from its chunk iterators, and the file is sent
+    # in blocks once xlsxwriter has assembled it. Errors after the response started
+    # can only be logged, so callers should check for empty results beforehand.
+    def generate():
+        yield b''
+        try:
+            with render(build, in_memory=in_memory) as spool:
+                while block := spool.read(SEND_BLOCK_SIZE):
+                    yield block
+        except Exception:
+            logger.exception(f"Failed to build {download_name}")
+            raise
+
+    response = Response(stream_with_context(generate()), mimetype=XLSX_MIMETYPE)
+    response.headers.set('Content-Disposition', 'attachment', **_disposition(download_name))
+    return response
+
+
+def _disposition(download_name):
+    # Same filename / filename* handling as flask.send_file
+    try:
+        download_name.encode('ascii')
+        return {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
@@ -0,0 +1,93 @@
+import decimal
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Column dtypes applied once, where frames are loaded (qb.read_sql, the snapshot), instead of
+# every merge and groupby working on Python strings and re-parsing dates.
+SCHEMA_ENABLED = os.getenv('SCHEMA_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Repeated labels become categoricals. Each column has one set of categories shared by every
+# frame (grown as new names are seen, kept sorted so ordering matches the strings'), so
+# merges and concatenations of frames loaded at different times stay categorical.
+# Groupbys over them must pass observed=True, or every unseen combination gets a row.
+CATEGORIES = ['COMPANY_NAME', 'KICHEN_NAME', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID']
+# Dates the reports compare or shift: MySQL DATETIMEs already arrive as datetime64, drivers
+# that return text (the SQLite stand-in) get the same
+DATES = ['OPERATION_DATE', 'FirstDate', 'start_date', 'end_date', 'baseline_end_date',
+         'LICENSE_START_DATE', 'LICENSE_EXPIRE_DATE']
+# Amounts stay float64: gram totals need more digits than float32 has, and the reports
+# round sums of them. Columns of Decimals are made numeric; other values under these names
+# (e.g. the MAX(UPDATE_DATE) aliases of DATA_WATERMARK_SQL) are left alone.
+AMOUNTS = ['AMOUNT', 'FW', 'CV', 'input']
+# Integer ids, downcast to the smallest integer type that holds them
+IDS = ['KC_STT_ID']
+
+_dtypes = {}
+_lock = threading.Lock()
+
+
+def dtype(column, labels=()):
+    # The shared CategoricalDtype of column, extended with any new labels
+    with _lock:
+        current = _dtypes.get(column)
+        known = current.categories if current is not None else pd.Index([], dtype=object)
+        labels = pd.Index(labels, dtype=object)
+        new = labels[~labels.isin(known)]
+        if current is None or len(new):
+            current = pd.CategoricalDtype(known.append(new).sort_values())
+            _dtypes[column] = current
+        return current
+
+
+def _categorical(column, series):
+    # series as the shared categorical, hashing the values once (factorize) and
+    # re-coding the few distinct labels
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, labels = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, labels = pd.factorize(series)
+    shared = dtype(column, labels)
+    if series.dtype == shared:
+        return series
+    remap = shared.categories.get_indexer(labels)
+    codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=shared), index=series.index, name=series.name)
+
+
+def _decimals(series):
+    valid = series.dropna()
+    return len(valid) > 0 and isinstance(valid.iloc[0], decimal.Decimal)
+
+
+def apply(df):
+    # Cast the registered columns of df in place and return it
+    if not SCHEMA_ENABLED or not isinstance(df, pd.DataFrame):
+        return df
+    for column in df.columns.intersection(CATEGORIES):
+        if df[column].dtype == object or isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = _categorical(column, df[column])
+    for column in df.columns.intersection(DATES):
+        if not pd.api.types.is_datetime64_any_dtype(df[column]):
+            try:
+                df[column] = pd.to_datetime(df[column])
+            except pd.errors.OutOfBoundsDatetime:
+                # Open-ended dates such as a 9999-12-31 license expiry do not fit datetime64[ns];
+                # second resolution holds them (NaT would drop live kitchens from license checks)
+                df[column] = df[column].astype('datetime64[s]')
+    for column in df.columns.intersection(AMOUNTS):
+        if df[column].dtype == object and _decimals(df[column]):
+            df[column] = pd.to_numeric(df[column])
+    for column in df.columns.intersection(IDS):
+        if pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def align(frames):
+    # Recast frames loaded together (e.g. by qb.fetch_all) to the categories as they stand
+    # once all of them are loaded, so merging them never falls back to object
+    for df in frames:
+        apply(df)
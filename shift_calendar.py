@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+# Each kitchen's weekly opening pattern as a 7 x 5 bitmask (bit = weekday * 5 + shift),
+# so scheduled shifts per period are counted from weekday counts instead of building a
+# row for every date x shift.
+SHIFTS = ['BREAKFAST', 'BRUNCH', 'LUNCH', 'AFTERNOON_TEA', 'DINNER']
+WEEKDAYS = ['MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY', 'SUNDAY']
+KEYS = ['COMPANY_NAME', 'KICHEN_NAME']
+
+_WEEKDAY_INDEX = {day: i for i, day in enumerate(WEEKDAYS)}
+
+
+def _days(values):
+    # Dates as integer days since 1970-01-01
+    return np.asarray(values, dtype='datetime64[D]').astype(np.int64)
+
+
+def _weekday(days):
+    # 1970-01-01 was a Thursday
+    return (days + 3) % 7
+
+
+def weekday_counts(first, last):
+    # (n, 7) number of Mondays..Sundays in each inclusive day range [first, last]
+    n = np.maximum(last - first + 1, 0)
+    offsets = (np.arange(7)[None, :] - _weekday(first)[:, None]) % 7
+    return n[:, None] // 7 + (offsets < (n % 7)[:, None])
+
+
+def buckets(start, end, grouping):
+    # Periods covering [start, end] as label columns plus first/last day (clipped to the range)
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    if grouping == 'overall':
+        labels = pd.DataFrame(index=[0])
+        first = pd.DatetimeIndex([start])
+    elif grouping == 'daily':
+        first = pd.date_range(start, end)
+        labels = pd.DataFrame({'OPERATION_DATE': first})
+    elif grouping == 'weekly':
+        first = pd.date_range(start - pd.Timedelta(days=start.weekday()), end, freq='7D')
+        labels = pd.DataFrame({'WEEK_START_DATE': first})
+    elif grouping == 'monthly':
+        first = pd.date_range(start.replace(day=1), end, freq='MS')
+        labels = pd.DataFrame({'YEAR': first.year, 'MONTH': first.month})
+    elif grouping == 'yearly':
+        first = pd.date_range(start.replace(month=1, day=1), end, freq='YS')
+        labels = pd.DataFrame({'YEAR': first.year})
+    else:
+        raise ValueError(f"Invalid grouping value: {grouping}. Choose from 'daily', 'weekly', 'monthly', 'yearly', 'overall'.")
+
+    if grouping == 'overall':
+        last = pd.DatetimeIndex([end])
+    elif grouping == 'daily':
+        last = first
+    elif grouping == 'weekly':
+        last = first + pd.Timedelta(days=6)
+    elif grouping == 'monthly':
+        last = first + pd.offsets.MonthEnd(0)
+    else:
+        last = first + pd.offsets.YearEnd(0)
+    labels['first'] = np.maximum(_days(first), _days(start))
+    labels['last'] = np.minimum(_days(last), _days(end))
+    return labels
+
+
+class ShiftCalendar:
+    # Scheduled shifts of every kitchen in opening_shifts between start_date and end_date,
+    # on days after the kitchen's FirstDate (start_date when it has none), exactly the
+    # rows DCON used to build with date_range / melt.
+    def __init__(self, opening_shifts, firstdate, start_date, end_date):
+        self.start = _days([pd.Timestamp(start_date).normalize()])[0]
+        self.end = _days([pd.Timestamp(end_date).normalize()])[0]
+
+        pattern = opening_shifts[opening_shifts['DAY_OF_WEEK'].str.upper().isin(WEEKDAYS)]
+        day = pattern['DAY_OF_WEEK'].str.upper().map(_WEEKDAY_INDEX).to_numpy(dtype=np.int64)
+        bits = np.zeros(len(pattern), dtype=np.int64)
+        for i, shift in enumerate(SHIFTS):
+            bits |= pattern[shift].eq('Y').to_numpy(dtype=np.int64) << (day * 5 + i)
+        masks = pd.Series(bits, index=pd.MultiIndex.from_frame(pattern[KEYS])).groupby(level=KEYS, observed=True).agg(np.bitwise_or.reduce)
+        self.kitchens = masks.index
+        self.masks = masks.to_numpy(dtype=np.int64)
+        # Open shifts per weekday, (kitchens, 7)
+        self.per_weekday = sum((self.masks[:, None] >> (np.arange(7) * 5 + i)) & 1 for i in range(len(SHIFTS)))
+
+        # First countable day: the day after FirstDate, never before start_date
+        first = firstdate.set_index(KEYS)['FirstDate'].reindex(self.kitchens)
+        first = pd.to_datetime(first).fillna(pd.Timestamp(start_date)).dt.normalize()
+        self.lower = np.maximum(_days(first) + 1, self.start)
+
+    def totals(self, grouping):
+        # TOTAL_SHIFTS per kitchen and period (label columns from buckets()), non-zero only
+        periods = buckets(pd.Timestamp(self.start, unit='D'), pd.Timestamp(self.end, unit='D'), grouping)
+        k, b = len(self.kitchens), len(periods)
+        first = np.maximum(periods['first'].to_numpy()[None, :], self.lower[:, None]).ravel()
+        last = np.broadcast_to(periods['last'].to_numpy(), (k, b)).ravel()
+        counts = weekday_counts(first, last)
+        total = (counts * np.repeat(self.per_weekday, b, axis=0)).sum(axis=1)
+
+        result = periods.drop(columns=['first', 'last']).iloc[np.tile(np.arange(b), k)].reset_index(drop=True)
+        kitchens = self.kitchens.to_frame(index=False).iloc[np.repeat(np.arange(k), b)].reset_index(drop=True)
+        result = pd.concat([kitchens, result], axis=1)
+        result['TOTAL_SHIFTS'] = total
+        return result[result['TOTAL_SHIFTS'] > 0].reset_index(drop=True)
+
+    def bounds(self):
+        # First and last scheduled day per kitchen (kitchens with at least one)
+        open_days = self.per_weekday > 0
+        first = self.lower[:, None] + (np.arange(7)[None, :] - _weekday(self.lower)[:, None]) % 7
+        last = self.end - (_weekday(self.end) - np.arange(7)[None, :]) % 7
+        first = np.where(open_days, first, np.iinfo(np.int64).max).min(axis=1)
+        last = np.where(open_days, last, np.iinfo(np.int64).min).max(axis=1)
+        keep = first <= np.minimum(last, self.end)
+        result = self.kitchens[keep].to_frame(index=False)
+        result['START_DATE'] = first[keep].astype('datetime64[D]').astype('datetime64[ns]')
+        result['END_DATE'] = last[keep].astype('datetime64[D]').astype('datetime64[ns]')
+        return result
+
+    def scheduled(self, df):
+        # Boolean per row of df (COMPANY_NAME, KICHEN_NAME, OPERATION_DATE, SHIFT_ID): is it a scheduled shift?
+        kitchen = self.kitchens.get_indexer(pd.MultiIndex.from_frame(df[KEYS]))
+        shift = pd.Index(SHIFTS).get_indexer(df['SHIFT_ID']).astype(np.int64)
+        days = _days(pd.to_datetime(df['OPERATION_DATE']).dt.normalize())
+        known = (kitchen >= 0) & (shift >= 0)
+        mask = np.where(known, self.masks[kitchen], 0)
+        lower = np.where(known, self.lower[kitchen], self.end + 1)
+        bit = _weekday(days) * 5 + np.maximum(shift, 0)
+        return known & (days >= lower) & (days <= self.end) & (((mask >> bit) & 1) == 1)
+
+    def rows(self):
+        # The scheduled shifts as (COMPANY_NAME, KICHEN_NAME, OPERATION_DATE, SHIFT_ID) rows,
+        # for callers that need them one by one; only daily-level consumers should ask
+        frames = []
+        for (company, kitchen), mask, lower in zip(self.kitchens, self.masks, self.lower):
+            days = np.arange(lower, self.end + 1)
+            for i, shift in enumerate(SHIFTS):
+                open_day = ((mask >> (_weekday(days) * 5 + i)) & 1) == 1
+                if open_day.any():
+                    frames.append(pd.DataFrame({
+                        'COMPANY_NAME': company, 'KICHEN_NAME': kitchen,
+                        'OPERATION_DATE': days[open_day].astype('datetime64[D]').astype('datetime64[ns]'),
+                        'SHIFT_ID': shift,
+                    }))
+        if not frames:
+            return pd.DataFrame(columns=KEYS + ['OPERATION_DATE', 'SHIFT_ID'])
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,133 @@
+import json
+import logging
+import logging.handlers
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements read through qb.read_sql that take longer than SLOW_QUERY_SECONDS (execute +
+# fetch + DataFrame build) are appended as JSON lines to a rotating local file, with their
+# parameters, row count, the three timings and an EXPLAIN plan taken on a separate
+# connection. /slow_queries browses them. Off unless SLOW_QUERY_ENABLED: the records hold raw
+# SQL, bound company / kitchen names and plans, so neither the file nor the page exists by default.
+SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'y')
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', 2.0))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'slow_queries.log'))
+SLOW_QUERY_LOG_BYTES = int(os.getenv('SLOW_QUERY_LOG_BYTES', 10 * 2 ** 20))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv('SLOW_QUERY_LOG_BACKUPS', 5))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes', 'y')
+
+_writer = None
+_lock = threading.Lock()
+_explainer = None
+
+
+def _log():
+    # Logger writing one JSON record per line to the rotating file (not to the app log)
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                os.makedirs(os.path.dirname(os.path.abspath(SLOW_QUERY_LOG)), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                writer = logging.getLogger('slow_queries.records')
+                writer.setLevel(logging.INFO)
+                writer.propagate = False
+                writer.addHandler(handler)
+                _writer = writer
+    return _writer
+
+
+def _explain_pool():
+    # EXPLAIN runs after the report got its rows, one at a time
+    global _explainer
+    if _explainer is None:
+        with _lock:
+            if _explainer is None:
+                _explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+    return _explainer
+
+
+def _reset_after_fork():
+    global _explainer
+    _explainer = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def explain(engine, statement, parameters):
+    # Plan of the statement exactly as the driver received it, on its own pooled connection
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with metrics.caller('slow_queries.explain'), engine.connect() as conn:
+        result = conn.exec_driver_sql(prefix + statement, parameters)
+        return [dict(row._mapping) for row in result]
+
+
+def _write(record, engine=None, statement=None, parameters=None):
+    if engine is not None:
+        try:
+            record['explain'] = explain(engine, statement, parameters)
+        except Exception as e:
+            record['explain_error'] = f"{type(e).__name__}: {e}"
+    _log().info(json.dumps(record, default=str))
+
+
+def check(engine, stmt, params, context, rows, execute_s, fetch_s, build_s):
+    # Record the read if it was slow; called by qb.read_sql after every frame it builds
+    total = execute_s + fetch_s + build_s
+    if total < SLOW_QUERY_SECONDS:
+        return
+    record = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'caller': metrics.current_caller(),
+        'seconds': round(total, 4),
+        'execute_s': round(execute_s, 4),
+        'fetch_s': round(fetch_s, 4),
+        'build_s': round(build_s, 4),
+        'rows': rows,
+        'sql': str(stmt).strip(),
+        'params': params or {},
+    }
+    logger.warning(f"slow query {record['caller']}: {total:.3f}s, {rows} rows")
+    if not SLOW_QUERY_ENABLED:
+        return
+    try:
+        if SLOW_QUERY_EXPLAIN and context is not None:
+            parameters = context.parameters[0] if context.parameters else ()
+            _explain_pool().submit(_write, record, engine, context.statement, parameters)
+        else:
+            _write(record)
+    except Exception:
+        logger.exception("Could not record a slow query")
+
+
+def records(limit=100, caller=None):
+    # Newest first, from the current file and its rotated backups
+    found = []
+    paths = [SLOW_QUERY_LOG] + [f"{SLOW_QUERY_LOG}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            continue
+        for line in reversed(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if caller and record.get('caller') != caller:
+                continue
+            found.append(record)
+            if len(found) >= limit:
+                return found
+    return found
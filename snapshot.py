@@ -0,0 +1,247 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import inspect
+
+import query_builder as qb
+import schema
+from db import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Local Parquet copy of the FW/CV fact tables (plus the small station/company
+# dimensions), refreshed incrementally by UPDATE_DATE. Reports read it instead of
+# rescanning MySQL when SNAPSHOT_ENABLED is set and a snapshot exists.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshot'))
+SNAPSHOT_ENABLED = os.getenv('SNAPSHOT_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'y')
+
+# Fact tables are synced by watermark; ACTIVE is kept so deactivated rows (ACTIVE='N') replace the old version
+FACT_TABLES = {
+    'KITCHEN_FOOD_WASTE': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID',
+                           'AMOUNT', 'ACTIVE', 'COMPLETE', 'UPDATE_DATE'],
+    'KITCHEN_COVER': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'AMOUNT', 'ACTIVE', 'UPDATE_DATE'],
+}
+
+# Used as the upsert key when the table has no primary key the inspector can see
+NATURAL_KEYS = {
+    'KITCHEN_FOOD_WASTE': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID'],
+    'KITCHEN_COVER': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID'],
+}
+
+# Small tables, reloaded in full on every sync
+DIMENSION_TABLES = {
+    'KITCHEN_STATION': ['KC_STT_ID', 'CPN_PF_ID', 'KICHEN_NAME', 'KICHEN_STATUS', 'ACTIVE', 'PRODUCTION_KITCHEN_FLAG'],
+    'COMPANY_PROFILE': ['CPN_PF_ID', 'COMPANY_NAME', 'COMPANY_STATUS', 'ACTIVE', 'WEIGHT_UNIT_CODE'],
+}
+
+_sync_lock = threading.Lock()
+_frames = {}
+_frames_lock = threading.Lock()
+
+
+def _path(table):
+    return os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+
+
+def _meta_path():
+    return os.path.join(SNAPSHOT_DIR, 'meta.json')
+
+
+def load_meta():
+    try:
+        with open(_meta_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_atomic(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _save_meta(meta):
+    tmp_path = _meta_path() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2, default=str)
+    os.replace(tmp_path, _meta_path())
+
+
+def _key_columns(engine, table):
+    try:
+        primary_key = inspect(engine).get_pk_constraint(table).get('constrained_columns') or []
+    except Exception:
+        primary_key = []
+    return primary_key if primary_key else NATURAL_KEYS[table]
+
+
+def _sync_fact(engine, table, watermark):
+    columns = FACT_TABLES[table]
+    key = _key_columns(engine, table)
+    select_columns = list(dict.fromkeys(key + columns))
+
+    # >= so rows committed with the watermark's own timestamp are not missed; the upsert is idempotent
+    sql = f"SELECT {', '.join(select_columns)} FROM {table}"
+    params = {}
+    if watermark:
+        sql += " WHERE UPDATE_DATE >= :watermark"
+        params['watermark'] = watermark
+    delta = qb.read_sql(qb.statement(sql), engine, params)
+
+    path = _path(table)
+    if watermark and os.path.exists(path):
+        current = pd.read_parquet(path)
+        merged = pd.concat([current, delta], ignore_index=True)
+        merged = merged.drop_duplicates(subset=key, keep='last')
+    else:
+        merged = delta
+    _write_atomic(merged, path)
+
+    new_watermark = watermark
+    if not delta.empty and delta['UPDATE_DATE'].notna().any():
+        new_watermark = str(pd.to_datetime(delta['UPDATE_DATE']).max())
+    logger.info(f"snapshot {table}: {len(delta)} changed rows, {len(merged)} total, watermark {new_watermark}")
+    return {'watermark': new_watermark, 'rows': len(merged), 'key': key, 'changed': len(delta)}
+
+
+def sync(engine=None, full=False):
+    # Pull rows changed since the last watermark (everything on the first run or with full=True)
+    engine = engine or get_engine()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with _sync_lock:
+        meta = {} if full else load_meta()
+        tables = meta.setdefault('tables', {})
+        for table in FACT_TABLES:
+            watermark = tables.get(table, {}).get('watermark')
+            tables[table] = _sync_fact(engine, table, watermark)
+        for table, columns in DIMENSION_TABLES.items():
+            df = qb.read_sql(qb.statement(f"SELECT {', '.join(columns)} FROM {table}"), engine)
+            _write_atomic(df, _path(table))
+            tables[table] = {'rows': len(df)}
+        meta['synced_at'] = datetime.now().isoformat(timespec='seconds')
+        _save_meta(meta)
+        with _frames_lock:
+            _frames.clear()
+    return meta
+
+
+def available():
+    return all(os.path.exists(_path(table)) for table in list(FACT_TABLES) + list(DIMENSION_TABLES))
+
+
+def enabled():
+    return SNAPSHOT_ENABLED and available()
+
+
+def watermark():
+    # Latest UPDATE_DATE across the fact tables, or None before the first sync
+    tables = load_meta().get('tables', {})
+    marks = [tables.get(table, {}).get('watermark') for table in FACT_TABLES]
+    marks = [mark for mark in marks if mark]
+    return max(marks) if marks else None
+
+
+def frame(table):
+    # Parquet files are read once per sync and shared; treat the result as read-only
+    mtime = os.path.getmtime(_path(table))
+    with _frames_lock:
+        cached = _frames.get(table)
+        if cached is None or cached[0] != mtime:
+            df = schema.apply(pd.read_parquet(_path(table)))
+            cached = (mtime, df)
+            _frames[table] = cached
+    return cached[1]
+
+
+def _active_kitchens(company_name=None, company_active=False):
+    # Active kitchens of active companies, with the same company LIKE '%name%' match as the SQL
+    ks = frame('KITCHEN_STATION')
+    cp = frame('COMPANY_PROFILE')
+    ks = ks[(ks['KICHEN_STATUS'] == 'Y') & (ks['ACTIVE'] == 'Y')]
+    cp = cp[cp['COMPANY_STATUS'] == 'ACTIVE']
+    if company_active:
+        cp = cp[cp['ACTIVE'] == 'Y']
+    if company_name:
+        cp = cp[cp['COMPANY_NAME'].str.contains(company_name, case=False, regex=False, na=False)]
+    return ks.merge(cp.drop(columns=['ACTIVE']), on='CPN_PF_ID', suffixes=('', '_cp'))
+
+
+def _facts(table, start_date, end_date):
+    df = frame(table)
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    return df[(df['ACTIVE'] == 'Y') & (df['OPERATION_DATE'] >= start) & (df['OPERATION_DATE'] <= end)]
+
+
+def total_fw(company_name, start_date, end_date):
+    kitchens = _active_kitchens(company_name)
+    fw = _facts('KITCHEN_FOOD_WASTE', start_date, end_date).merge(
+        kitchens[['KC_STT_ID', 'COMPANY_NAME', 'KICHEN_NAME']], on='KC_STT_ID')
+    fw = fw.sort_values('OPERATION_DATE', kind='stable')
+    return fw[['OPERATION_DATE', 'COMPANY_NAME', 'KICHEN_NAME', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID', 'AMOUNT']].reset_index(drop=True)
+
+
+def fw_entries(company_name, start_date, end_date):
+    kitchens = _active_kitchens(company_name, company_active=True)
+    fw = _facts('KITCHEN_FOOD_WASTE', start_date, end_date).merge(
+        kitchens[['KC_STT_ID', 'COMPANY_NAME', 'KICHEN_NAME']], on='KC_STT_ID')
+    fw = fw.sort_values(['KICHEN_NAME', 'OPERATION_DATE'], kind='stable')
+    fw['OPERATION_DATE'] = fw['OPERATION_DATE'].dt.date
+    return fw[['OPERATION_DATE', 'COMPANY_NAME', 'KICHEN_NAME', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'AMOUNT', 'IGD_FOODTYPE_ID']].reset_index(drop=True)
+
+
+def cv_entries(company_name, start_date, end_date):
+    kitchens = _active_kitchens(company_name, company_active=True)
+    cv = _facts('KITCHEN_COVER', start_date, end_date).merge(
+        kitchens[['KC_STT_ID', 'COMPANY_NAME', 'KICHEN_NAME']], on='KC_STT_ID')
+    cv = cv.sort_values(['KICHEN_NAME', 'OPERATION_DATE'], kind='stable')
+    cv['OPERATION_DATE'] = cv['OPERATION_DATE'].dt.date
+    return cv[['OPERATION_DATE', 'COMPANY_NAME', 'KICHEN_NAME', 'SHIFT_ID', 'AMOUNT']].reset_index(drop=True)
+
+
+def food_waste_and_covers(start_date, end_date, company_name=None, restaurant_name=None, shift=None, category=None,
+                          food_type=None, CONS=False):
+    # Snapshot version of the get_food_waste_and_covers query (FW summed per kitchen, day, shift,
+    # category and food type, with that shift's covers)
+    ks = frame('KITCHEN_STATION')
+    cp = frame('COMPANY_PROFILE')
+    kitchens = ks.merge(cp[['CPN_PF_ID', 'COMPANY_NAME', 'WEIGHT_UNIT_CODE']], on='CPN_PF_ID')
+    for column, value in (('COMPANY_NAME', company_name), ('KICHEN_NAME', restaurant_name)):
+        if value:
+            values = value if isinstance(value, list) else [value]
+            kitchens = kitchens[kitchens[column].isin(values)]
+
+    fw = _facts('KITCHEN_FOOD_WASTE', start_date, end_date)
+    if CONS:
+        fw = fw[fw['COMPLETE'] == 'Y']
+    for column, value in (('SHIFT_ID', shift), ('IGD_CATEGORY_ID', category), ('IGD_FOODTYPE_ID', food_type)):
+        if value and value != 'ALL':
+            fw = fw[fw[column] == value.upper()]
+    fw = fw.merge(kitchens[['KC_STT_ID', 'COMPANY_NAME', 'KICHEN_NAME', 'WEIGHT_UNIT_CODE']], on='KC_STT_ID')
+
+    keys = ['COMPANY_NAME', 'KICHEN_NAME', 'KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID']
+    grouped = fw.groupby(keys, dropna=False, observed=True).agg(FW=('AMOUNT', 'sum'), weight_unit=('WEIGHT_UNIT_CODE', 'first')).reset_index()
+
+    cv = frame('KITCHEN_COVER')
+    cv = cv[cv['KC_STT_ID'].isin(grouped['KC_STT_ID'].unique())]
+    cv = cv.drop_duplicates(subset=['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID'], keep='last')
+    grouped = grouped.merge(cv[['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'AMOUNT']].rename(columns={'AMOUNT': 'CV'}),
+                            on=['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID'], how='left')
+    grouped['OPERATION_DATE'] = grouped['OPERATION_DATE'].dt.normalize()
+    return grouped[['OPERATION_DATE', 'COMPANY_NAME', 'KICHEN_NAME', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID',
+                    'FW', 'CV', 'weight_unit']]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Sync the local FW/CV snapshot from MySQL')
+    parser.add_argument('--full', action='store_true', help='reload everything instead of syncing by UPDATE_DATE')
+    args = parser.parse_args()
+    meta = sync(full=args.full)
+    print(json.dumps(meta, indent=2, default=str))
@@ -0,0 +1,320 @@
+import argparse
+import json
+import logging
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from dummy_kitchens import demo_kitchens, trial_kitchens
+from units import CONVERSION_FACTORS
+
+logger = logging.getLogger(__name__)
+
+# Synthetic lightblue tables for running the reports and benchmarks without the production
+# database: companies with kitchens, licenses, baselines and opening hours, and the FW /
+# cover / closure entries of every scheduled shift. Written to a SQLite file (db.py gives
+# it DAYNAME, CURDATE and the lightblue schema) or any MySQL database; point the app at it
+# with DATABASE_URL.
+STANDIN_URL = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'standin.sqlite3')
+
+SHIFTS = ['BREAKFAST', 'BRUNCH', 'LUNCH', 'AFTERNOON_TEA', 'DINNER']
+DAYS = ['MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY', 'SUNDAY']
+# Share of a shift's waste in each category; a category is recorded with the given probability
+CATEGORIES = {'PREPARATION': (0.35, 0.85), 'SPOILAGE': (0.10, 0.45), 'BUFFET': (0.35, 0.75), 'PLATE': (0.20, 0.70)}
+FOODTYPES = ['MEAT', 'SEAFOOD', 'DAIRY', 'STAPLE_FOOD', 'FRUIT', 'VEGETABLE', 'OTHERS']
+FOODTYPE_SHARES = [0.22, 0.10, 0.08, 0.25, 0.10, 0.17, 0.08]
+
+# Brands matched by parent_companies.ini, and a few independents (their own parent)
+BRANDS = ['Hyatt Regency', 'Grand Hyatt', 'Andaz', 'Alila', 'JW Marriott', 'Courtyard', 'Sheraton', 'Aloft',
+          'Constance', 'Magic', 'Lagoon', 'Harbour']
+CITIES = ['Bangkok', 'Phuket', 'Singapore', 'Dubai', 'Tokyo', 'Bali', 'Mauritius', 'Maldives', 'Hong Kong',
+          'Kuala Lumpur', 'Seoul', 'Sydney', 'Vancouver', 'Lisbon', 'Doha']
+COUNTRIES = ['TH', 'SG', 'AE', 'JP', 'ID', 'MU', 'MV', 'HK', 'MY', 'KR', 'AU', 'CA', 'PT', 'QA']
+# Kitchen name -> (shifts it serves, mean covers per shift, chance each shift is open on a day)
+KITCHENS = {
+    'All Day Dining': (['BREAKFAST', 'LUNCH', 'DINNER'], 160, 0.97),
+    'Staff Canteen': (['BREAKFAST', 'LUNCH', 'DINNER'], 260, 0.95),
+    'Banquet': (['LUNCH', 'DINNER'], 220, 0.55),
+    'Main Kitchen': (['BREAKFAST', 'LUNCH', 'DINNER'], 300, 0.97),
+    'Lobby Lounge': (['AFTERNOON_TEA'], 50, 0.9),
+    'Pastry': (['BREAKFAST', 'AFTERNOON_TEA'], 90, 0.9),
+    'Italian': (['LUNCH', 'DINNER'], 70, 0.85),
+    'Japanese': (['DINNER'], 60, 0.85),
+    'Pool Bar': (['LUNCH', 'AFTERNOON_TEA'], 40, 0.8),
+    'Room Service': (['BREAKFAST', 'DINNER'], 35, 0.95),
+    'Grill': (['DINNER'], 80, 0.8),
+    'Coffee Shop': (['BREAKFAST', 'LUNCH'], 120, 0.9),
+}
+PRODUCTION_KITCHENS = {'Main Kitchen'}
+UNIT_SHARES = {'KILOGRAM': 0.6, 'GRAM': 0.25, 'POUND': 0.15}
+
+# Columns loaded per table, as the queries read them
+TABLES = {
+    'COMPANY_PROFILE': ['CPN_PF_ID', 'COMPANY_NAME', 'COMPANY_STATUS', 'ACTIVE', 'WEIGHT_UNIT_CODE',
+                        'WEEKLY_REPORT_MAIL_TO', 'WEEKLY_REPORT_MAIL_CC'],
+    'COMPANY_REGISTER': ['CPN_PF_ID', 'WEEKLY_REPORT_EMAIL'],
+    'COMPANY_ACTIVATE': ['CPN_PF_ID', 'LICENSE_START_DATE', 'LICENSE_EXPIRE_DATE', 'COUNTRY_CODE'],
+    'KITCHEN_STATION': ['KC_STT_ID', 'CPN_PF_ID', 'KICHEN_NAME', 'KICHEN_STATUS', 'ACTIVE', 'PRODUCTION_KITCHEN_FLAG'],
+    'KITCHEN_BASELINE': ['KC_STT_ID', 'BASELINE_START_DATE', 'BASELINE_END_DATE', 'ACTIVE'],
+    'KITCHEN_OPERATION_SHIFT': ['KC_STT_ID', 'CPN_PF_ID', 'DAY_OF_WEEK', *SHIFTS, 'ACTIVE', 'OPERATION_SHIFT_TYPE'],
+    'KITCHEN_FOOD_WASTE': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'IGD_CATEGORY_ID', 'IGD_FOODTYPE_ID',
+                           'AMOUNT', 'ACTIVE', 'COMPLETE', 'UPDATE_DATE'],
+    'KITCHEN_COVER': ['KC_STT_ID', 'OPERATION_DATE', 'SHIFT_ID', 'AMOUNT', 'ACTIVE', 'UPDATE_DATE'],
+    'KITCHEN_SHIFT_CLOSE': ['KC_STT_ID', 'CPN_PF_ID', 'CLOSE_DATE', 'SHIFT_ID', 'ACTIVE', 'UPDATE_DATE'],
+}
+INDEXES = {
+    'KITCHEN_FOOD_WASTE': ['KC_STT_ID', 'OPERATION_DATE'],
+    'KITCHEN_COVER': ['KC_STT_ID', 'OPERATION_DATE'],
+    'KITCHEN_SHIFT_CLOSE': ['KC_STT_ID', 'CLOSE_DATE'],
+    'KITCHEN_OPERATION_SHIFT': ['KC_STT_ID'],
+    'KITCHEN_BASELINE': ['KC_STT_ID'],
+    'KITCHEN_STATION': ['KC_STT_ID'],
+    'COMPANY_ACTIVATE': ['CPN_PF_ID'],
+}
+
+
+def _days(rng, low, high, size=None):
+    return rng.integers(low, high + 1, size)
+
+
+def companies(rng, count, start, end):
+    # Real brands (every brand once before any repeats) with a city each; one trial and two
+    # demo companies (from calculations' exclusion lists) are added so the Dummies filters
+    # have something to drop
+    brands = np.concatenate([rng.permutation(BRANDS) for _ in range(count // len(BRANDS) + 1)])
+    names = []
+    for i in range(count):
+        name = f"{brands[i]} {CITIES[rng.integers(len(CITIES))]}"
+        names.append(name if name not in names else f"{name} {i}")
+    dummies = list(dict.fromkeys(company for _, company in trial_kitchens[:1] + demo_kitchens))[:3]
+    names += dummies
+    n = len(names)
+    span = (end - start).days
+    onboarded = [start + timedelta(days=int(d)) for d in _days(rng, 0, max(span - 120, 0), n)]
+    # Most licenses run past the end date; some lapsed (the company stopped recording)
+    lapsed = rng.random(n) < 0.1
+    expire = [end - timedelta(days=int(_days(rng, 1, max((end - day).days - 90, 1)))) if gone
+              else end + timedelta(days=int(_days(rng, 30, 400))) for day, gone in zip(onboarded, lapsed)]
+    mail = rng.random(n) < 0.6
+    profile = pd.DataFrame({
+        'CPN_PF_ID': np.arange(1, n + 1),
+        'COMPANY_NAME': names,
+        'COMPANY_STATUS': np.where(rng.random(n) < 0.97, 'ACTIVE', 'INACTIVE'),
+        'ACTIVE': 'Y',
+        'WEIGHT_UNIT_CODE': rng.choice(list(UNIT_SHARES), n, p=list(UNIT_SHARES.values())),
+        'WEEKLY_REPORT_MAIL_TO': [f"chef{i}@example.com" if m else None for i, m in enumerate(mail, 1)],
+        'WEEKLY_REPORT_MAIL_CC': [f"gm{i}@example.com" if m and rng.random() < 0.5 else None for i, m in enumerate(mail, 1)],
+    })
+    register = pd.DataFrame({'CPN_PF_ID': profile['CPN_PF_ID'],
+                             'WEEKLY_REPORT_EMAIL': [f"owner{i}@example.com" for i in profile['CPN_PF_ID']]})
+    activate = pd.DataFrame({
+        'CPN_PF_ID': profile['CPN_PF_ID'],
+        'LICENSE_START_DATE': [day - timedelta(days=int(d)) for day, d in zip(onboarded, _days(rng, 0, 30, n))],
+        'LICENSE_EXPIRE_DATE': expire,
+        'COUNTRY_CODE': rng.choice(COUNTRIES, n),
+    })
+    activate['onboarded'] = onboarded
+    return profile, register, activate
+
+
+def kitchens(rng, profile, activate, per_company, end):
+    dummy_kitchens = {company: [] for company in profile['COMPANY_NAME']}
+    for kitchen, company in trial_kitchens + demo_kitchens:
+        if company in dummy_kitchens:
+            dummy_kitchens[company].append(kitchen)
+    rows = []
+    for company_id, company, onboarded in zip(profile['CPN_PF_ID'], profile['COMPANY_NAME'], activate['onboarded']):
+        names = dummy_kitchens[company] or list(rng.choice(list(KITCHENS), min(len(KITCHENS), 1 + rng.poisson(max(per_company - 1, 0))), replace=False))
+        for name in names:
+            rows.append({'CPN_PF_ID': company_id, 'KICHEN_NAME': name, 'kind': name if name in KITCHENS else rng.choice(list(KITCHENS)),
+                         'onboarded': onboarded + timedelta(days=int(_days(rng, 0, 60)))})
+    station = pd.DataFrame(rows)
+    n = len(station)
+    station['KC_STT_ID'] = np.arange(101, 101 + n)
+    station['KICHEN_STATUS'] = np.where(rng.random(n) < 0.95, 'Y', 'N')
+    station['ACTIVE'] = 'Y'
+    station['PRODUCTION_KITCHEN_FLAG'] = np.where(station['kind'].isin(PRODUCTION_KITCHENS), 'Y', 'N')
+
+    # A four to six week baseline from onboarding; a quarter of the kitchens ran a second one later
+    baseline_rows = []
+    for kc_stt_id, onboarded in zip(station['KC_STT_ID'], station['onboarded']):
+        start = onboarded
+        for _ in range(2 if rng.random() < 0.25 else 1):
+            finish = start + timedelta(days=int(_days(rng, 28, 42)))
+            if finish >= end:
+                break
+            baseline_rows.append({'KC_STT_ID': kc_stt_id, 'BASELINE_START_DATE': start, 'BASELINE_END_DATE': finish,
+                                  'ACTIVE': 'Y' if rng.random() < 0.97 else 'N'})
+            start = finish + timedelta(days=int(_days(rng, 180, 400)))
+    baseline = pd.DataFrame(baseline_rows, columns=TABLES['KITCHEN_BASELINE'])
+
+    # Opening hours: the kitchen's shifts, each open on most days; brunch replaces breakfast
+    # on weekends in some kitchens
+    shift_rows = []
+    for kc_stt_id, company_id, kind in zip(station['KC_STT_ID'], station['CPN_PF_ID'], station['kind']):
+        served, _, open_rate = KITCHENS[kind]
+        brunch = 'BREAKFAST' in served and rng.random() < 0.3
+        for day in DAYS:
+            row = {'KC_STT_ID': kc_stt_id, 'CPN_PF_ID': company_id, 'DAY_OF_WEEK': day, 'ACTIVE': 'Y',
+                   'OPERATION_SHIFT_TYPE': 'SHIFT_MAIN'}
+            for shift in SHIFTS:
+                row[shift] = 'Y' if shift in served and rng.random() < open_rate else 'N'
+            if brunch and day in ('SATURDAY', 'SUNDAY'):
+                row['BREAKFAST'], row['BRUNCH'] = 'N', 'Y'
+            shift_rows.append(row)
+    operation_shift = pd.DataFrame(shift_rows, columns=TABLES['KITCHEN_OPERATION_SHIFT'])
+    return station, baseline, operation_shift
+
+
+def scheduled_shifts(station, activate, operation_shift, end):
+    # One row per kitchen, day and open shift from onboarding to the end date (or the
+    # license's expiry)
+    expire = station['CPN_PF_ID'].map(activate.set_index('CPN_PF_ID')['LICENSE_EXPIRE_DATE'])
+    last = pd.to_datetime(expire).clip(upper=pd.Timestamp(end))
+    first = pd.to_datetime(station['onboarded'])
+    lengths = np.maximum((last - first).dt.days.to_numpy() + 1, 0)
+    days = pd.DataFrame({
+        'KC_STT_ID': np.repeat(station['KC_STT_ID'].to_numpy(), lengths),
+        'OPERATION_DATE': np.repeat(first.to_numpy(), lengths) + pd.to_timedelta(
+            np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths), unit='D'),
+    })
+    days['DAY_OF_WEEK'] = np.array(DAYS)[days['OPERATION_DATE'].dt.dayofweek]
+    hours = operation_shift.melt(id_vars=['KC_STT_ID', 'DAY_OF_WEEK'], value_vars=SHIFTS, var_name='SHIFT_ID')
+    hours = hours[hours['value'] == 'Y'].drop(columns='value')
+    return days.merge(hours, on=['KC_STT_ID', 'DAY_OF_WEEK']).drop(columns='DAY_OF_WEEK')
+
+
+def facts(rng, station, profile, baseline, shifts, closed_rate, fill_rate):
+    n = len(shifts)
+    kitchen = station.set_index('KC_STT_ID')
+    kind = shifts['KC_STT_ID'].map(kitchen['kind'])
+    # Per kitchen: how diligently it records, its waste per cover and how much it saves
+    # after its first baseline
+    engagement = pd.Series(rng.beta(8 * fill_rate, 8 * (1 - fill_rate), len(station)), index=station['KC_STT_ID'])
+    grams_per_cover = pd.Series(rng.lognormal(np.log(120), 0.35, len(station)), index=station['KC_STT_ID'])
+    saving = pd.Series(rng.uniform(0.05, 0.35, len(station)), index=station['KC_STT_ID'])
+    first_baseline = baseline.groupby('KC_STT_ID')['BASELINE_END_DATE'].min().reindex(station['KC_STT_ID'])
+
+    closed = rng.random(n) < closed_rate
+    recorded = ~closed & (rng.random(n) < shifts['KC_STT_ID'].map(engagement).to_numpy())
+    complete = np.where(rng.random(n) < 0.92, 'Y', 'N')
+    weekend = shifts['OPERATION_DATE'].dt.dayofweek.to_numpy() >= 5
+    mean_covers = kind.map({name: covers for name, (_, covers, _) in KITCHENS.items()}).to_numpy()
+    covers = np.maximum(np.round(mean_covers * np.where(weekend, 1.2, 1.0) * rng.lognormal(0, 0.25, n)), 1)
+    months_after = ((shifts['OPERATION_DATE'] - pd.to_datetime(shifts['KC_STT_ID'].map(first_baseline))).dt.days / 30).clip(lower=0).fillna(0)
+    reduction = 1 - shifts['KC_STT_ID'].map(saving).to_numpy() * np.minimum(months_after.to_numpy() / 6, 1)
+    grams = covers * shifts['KC_STT_ID'].map(grams_per_cover).to_numpy() * reduction * rng.lognormal(0, 0.3, n)
+    factor = shifts['KC_STT_ID'].map(kitchen['CPN_PF_ID']).map(
+        profile.set_index('CPN_PF_ID')['WEIGHT_UNIT_CODE'].map(CONVERSION_FACTORS)).to_numpy()
+    entered = shifts['OPERATION_DATE'] + pd.to_timedelta(rng.integers(14 * 3600, 72 * 3600, n), unit='s')
+
+    # FW: every category x food type of a recorded shift, kept at random; amounts are the
+    # shift's grams split by share, in the company's unit
+    idx = np.flatnonzero(recorded)
+    pairs = [(category, foodtype, share * FOODTYPE_SHARES[j], keep)
+             for category, (share, keep) in CATEGORIES.items() for j, foodtype in enumerate(FOODTYPES)]
+    rows = np.repeat(idx, len(pairs))
+    pair = np.tile(np.arange(len(pairs)), len(idx))
+    keep = rng.random(len(rows)) < np.array([p[3] for p in pairs])[pair] * 0.6
+    rows, pair = rows[keep], pair[keep]
+    shares = np.array([p[2] for p in pairs])[pair] * rng.lognormal(0, 0.4, len(rows))
+    food_waste = pd.DataFrame({
+        'KC_STT_ID': shifts['KC_STT_ID'].to_numpy()[rows],
+        'OPERATION_DATE': shifts['OPERATION_DATE'].to_numpy()[rows],
+        'SHIFT_ID': shifts['SHIFT_ID'].to_numpy()[rows],
+        'IGD_CATEGORY_ID': np.array([p[0] for p in pairs])[pair],
+        'IGD_FOODTYPE_ID': np.array([p[1] for p in pairs])[pair],
+        'AMOUNT': np.round(grams[rows] * shares / factor[rows], 3),
+        'ACTIVE': np.where(rng.random(len(rows)) < 0.99, 'Y', 'N'),
+        'COMPLETE': complete[rows],
+        'UPDATE_DATE': entered.to_numpy()[rows],
+    })
+
+    with_cover = idx[rng.random(len(idx)) < 0.95]
+    cover = pd.DataFrame({
+        'KC_STT_ID': shifts['KC_STT_ID'].to_numpy()[with_cover],
+        'OPERATION_DATE': shifts['OPERATION_DATE'].to_numpy()[with_cover],
+        'SHIFT_ID': shifts['SHIFT_ID'].to_numpy()[with_cover],
+        'AMOUNT': covers[with_cover],
+        'ACTIVE': 'Y',
+        'UPDATE_DATE': entered.to_numpy()[with_cover],
+    })
+
+    # Closures are mostly entered ahead of the day; a few were reopened (ACTIVE='N')
+    idx = np.flatnonzero(closed)
+    shift_close = pd.DataFrame({
+        'KC_STT_ID': shifts['KC_STT_ID'].to_numpy()[idx],
+        'CPN_PF_ID': shifts['KC_STT_ID'].map(kitchen['CPN_PF_ID']).to_numpy()[idx],
+        'CLOSE_DATE': shifts['OPERATION_DATE'].to_numpy()[idx],
+        'SHIFT_ID': shifts['SHIFT_ID'].to_numpy()[idx],
+        'ACTIVE': np.where(rng.random(len(idx)) < 0.97, 'Y', 'N'),
+        'UPDATE_DATE': shifts['OPERATION_DATE'].to_numpy()[idx] - pd.to_timedelta(rng.integers(0, 14 * 86400, len(idx)), unit='s'),
+    })
+    return food_waste, cover, shift_close
+
+
+def generate(companies_count=10, kitchens_per_company=3, years=3, closed_rate=0.05, fill_rate=0.8, end=None, seed=0):
+    # All tables as DataFrames, keyed by table name
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    start = end - timedelta(days=int(365 * years))
+    profile, register, activate = companies(rng, companies_count, start, end)
+    station, baseline, operation_shift = kitchens(rng, profile, activate, kitchens_per_company, end)
+    shifts = scheduled_shifts(station, activate, operation_shift, end)
+    food_waste, cover, shift_close = facts(rng, station, profile, baseline, shifts, closed_rate, fill_rate)
+    tables = {
+        'COMPANY_PROFILE': profile, 'COMPANY_REGISTER': register, 'COMPANY_ACTIVATE': activate,
+        'KITCHEN_STATION': station, 'KITCHEN_BASELINE': baseline, 'KITCHEN_OPERATION_SHIFT': operation_shift,
+        'KITCHEN_FOOD_WASTE': food_waste, 'KITCHEN_COVER': cover, 'KITCHEN_SHIFT_CLOSE': shift_close,
+    }
+    tables = {name: df[TABLES[name]].copy() for name, df in tables.items()}
+    # Days are DATE columns (stored as 'YYYY-MM-DD' in SQLite, as DATE(...) returns them)
+    for name, columns in [('KITCHEN_FOOD_WASTE', ['OPERATION_DATE']), ('KITCHEN_COVER', ['OPERATION_DATE']),
+                          ('KITCHEN_SHIFT_CLOSE', ['CLOSE_DATE'])]:
+        for column in columns:
+            tables[name][column] = tables[name][column].dt.date
+    for name in ('KITCHEN_FOOD_WASTE', 'KITCHEN_COVER', 'KITCHEN_SHIFT_CLOSE'):
+        tables[name]['UPDATE_DATE'] = tables[name]['UPDATE_DATE'].dt.floor('s')
+    return tables
+
+
+def load(tables, url=STANDIN_URL, chunksize=50_000):
+    # Replace the tables at url with the generated ones and index the join / range columns
+    if url.startswith('sqlite:///'):
+        os.makedirs(os.path.dirname(os.path.abspath(url[len('sqlite:///'):])), exist_ok=True)
+    engine = sqlalchemy.create_engine(url)
+    try:
+        for name, df in tables.items():
+            df.to_sql(name, engine, if_exists='replace', index=False, chunksize=chunksize)
+            if name in INDEXES:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f"CREATE INDEX ix_{name.lower()} ON {name} ({', '.join(INDEXES[name])})")
+            logger.info(f"Loaded {len(df)} rows into {name}")
+        # Planner statistics, as a live database keeps them; without them SQLite range-scans
+        # KITCHEN_COVER per food waste row in the savings queries
+        if engine.dialect.name == 'sqlite':
+            with engine.begin() as conn:
+                conn.exec_driver_sql('ANALYZE')
+    finally:
+        engine.dispose()
+    return {name: len(df) for name, df in tables.items()}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Generate synthetic lightblue tables into a stand-in database')
+    parser.add_argument('--url', default=STANDIN_URL,
+                        help='target database; its tables are replaced (default: %(default)s)')
+    parser.add_argument('--companies', type=int, default=10, help='companies, plus one trial and two demo companies')
+    parser.add_argument('--kitchens', type=int, default=3, help='mean kitchens per company')
+    parser.add_argument('--years', type=float, default=3, help='years of entries up to --end')
+    parser.add_argument('--closed-rate', type=float, default=0.05, help='share of scheduled shifts closed')
+    parser.add_argument('--fill-rate', type=float, default=0.8, help='mean share of open shifts with entries')
+    parser.add_argument('--end', type=date.fromisoformat, help='last day with entries (YYYY-MM-DD, default today)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    tables = generate(args.companies, args.kitchens, args.years, args.closed_rate, args.fill_rate, args.end, args.seed)
+    print(json.dumps(load(tables, args.url), indent=2))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+# Conversion factors for the company weight units (COMPANY_PROFILE.WEIGHT_UNIT_CODE)
+CONVERSION_FACTORS = {
+    'KILOGRAM': 1000,   # kilograms to grams
+    'POUND': 453.592,  # pounds to grams
+    'GRAM': 1         # grams to grams
+}
+
+UNITS = list(CONVERSION_FACTORS)
+# Categorical code -1 (unknown unit or missing) takes the last factor: left as is
+_FACTORS = np.array([CONVERSION_FACTORS[unit] for unit in UNITS] + [1], dtype='float64')
+
+
+def grams_factor(units):
+    # Factor per row without a Python-level loop: unit codes index into the factor array
+    codes = pd.Categorical(units, categories=UNITS).codes
+    return np.take(_FACTORS, codes)
+
+
+def to_grams(amount, units):
+    return np.asarray(amount, dtype='float64') * grams_factor(units)
+
+
+def add_grams(df, amount_column, grams_column, unit_column='weight_unit'):
+    # Adds grams_column = amount_column converted from each row's weight unit
+    df[grams_column] = to_grams(df[amount_column], df[unit_column])
+    return df